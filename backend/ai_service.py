@@ -4,15 +4,346 @@ AI Service for Legal Document Analysis using Google Gemini
 """
 
 import os
-from dotenv import load_dotenv
 import google.generativeai as genai
-from typing import Dict, List, Any
+from google.api_core import exceptions as google_exceptions
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from typing import Dict, List, Any, Optional, Tuple, TypedDict, AsyncIterator, Union
 import json
-import re
+import hashlib
+import copy
+import functools
+import asyncio
+import logging
+import threading
 from datetime import datetime
+from cachetools import LRUCache
 
-# Load environment variables
-load_dotenv()
+# orjson is optional; its JSONDecodeError subclasses json.JSONDecodeError
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    orjson = None
+    _loads = json.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+# Load environment variables from .env in development; deployments inject them directly
+if os.getenv("ENV", "dev") == "dev":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Response cache configuration; entries are appended to a JSON-lines file and the
+# newest CACHE_MAX_ENTRIES are reloaded (and the file compacted) at startup
+CACHE_NAMESPACE = "gemini-1.5-flash-analysis"
+CACHE_PATH = os.getenv("AI_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ai_cache.jsonl"))
+CACHE_MAX_ENTRIES = 1024
+
+# Batch analysis limits
+BATCH_MAX_DOCUMENTS = 5
+BATCH_MAX_CHARS = 100_000
+
+# Long-document chunking
+CHUNK_MAX_CHARS = 100_000
+CHUNK_OVERLAP = 2000
+
+_RISK_LEVELS = ["Low", "Medium", "High", "Critical"]
+
+# Shared model configuration
+_GEN_CONFIG = {
+    "temperature": 0.3,
+    "top_p": 0.95,
+    "top_k": 64,
+    "max_output_tokens": 8192,
+    "response_mime_type": "application/json",
+}
+
+_SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
+
+# Analysis result validation: (key, default, validator) applied in a single pass
+_VALID_RISK_LEVELS = frozenset(_RISK_LEVELS)
+
+
+def _validate_risk_level(value: Any) -> bool:
+    return isinstance(value, str) and value in _VALID_RISK_LEVELS
+
+
+def _validate_score_0_100(value: Any) -> bool:
+    return isinstance(value, (int, float)) and 0 <= value <= 100
+
+
+def _validate_0_1(value: Any) -> bool:
+    return isinstance(value, (int, float)) and 0 <= value <= 1
+
+
+_SCHEMA = (
+    ("summary", "Document analysis completed", None),
+    ("document_type", "Legal Document", None),
+    ("key_clauses", [], None),
+    ("risks", [], None),
+    ("obligations", [], None),
+    ("overall_risk_score", 50, _validate_score_0_100),
+    ("overall_risk_level", "Medium", _validate_risk_level),
+    ("compliance_issues", [], None),
+    ("recommendations", [], None),
+    ("confidence_score", 0.8, _validate_0_1),
+)
+
+# Fallback analysis returned when AI processing fails (summary is filled in per call)
+_FALLBACK_TEMPLATE = {
+    "document_type": "Legal Document",
+    "key_clauses": [
+        "Standard legal clauses identified",
+        "Terms and conditions section",
+        "Rights and obligations outlined"
+    ],
+    "risks": [
+        {
+            "type": "General Risk",
+            "level": "Medium",
+            "description": "Standard legal risks associated with this document type",
+            "recommendation": "Review with legal counsel for specific requirements"
+        }
+    ],
+    "obligations": [
+        {
+            "party": "All parties",
+            "description": "Standard legal obligations apply",
+            "deadline": None
+        }
+    ],
+    "overall_risk_score": 50,
+    "overall_risk_level": "Medium",
+    "compliance_issues": [
+        "Recommend compliance review with current regulations"
+    ],
+    "recommendations": [
+        "Review document with qualified legal counsel",
+        "Ensure all parties understand their obligations",
+        "Verify compliance with applicable laws and regulations"
+    ],
+    "confidence_score": 0.6
+}
+
+# Static prompt segments; the JSON structure itself is supplied via response_schema
+_ANALYSIS_GUIDANCE = (
+    "Risk levels must be one of Low, Medium, High, or Critical. "
+    "overall_risk_score is an integer from 1-100 and confidence_score is a float from 0.0-1.0."
+)
+# Static instructions are sent as system instructions so each request carries only the document
+_ANALYZE_SYSTEM = (
+    "You are an expert legal document analyzer. Analyze the legal document provided "
+    "and give a comprehensive analysis in JSON format. " + _ANALYSIS_GUIDANCE
+    + " Provide only the JSON response, no additional text or explanations."
+)
+_ANALYZE_PREFIX = "Document Filename: "
+_ANALYZE_MIDDLE = "\nDocument Content:\n"
+
+_QUESTION_SYSTEM = (
+    "You are an expert legal advisor. Based on the legal document provided, "
+    "answer the user's question with accuracy and detail. "
+    "Repeat the question in the question field and give confidence as a float from 0.0-1.0. "
+    "Provide only the JSON response."
+)
+_QUESTION_PREFIX = "Document: "
+_QUESTION_MIDDLE = "\nDocument Content:\n"
+_QUESTION_ASK = "\n\nUser Question: "
+
+# Response schemas for Gemini structured output
+class _RiskSchema(TypedDict):
+    type: str
+    level: str
+    description: str
+    recommendation: str
+
+class _ObligationSchema(TypedDict):
+    party: str
+    description: str
+    deadline: str
+
+class _AnalysisSchema(TypedDict):
+    summary: str
+    document_type: str
+    key_clauses: List[str]
+    risks: List[_RiskSchema]
+    obligations: List[_ObligationSchema]
+    overall_risk_score: int
+    overall_risk_level: str
+    compliance_issues: List[str]
+    recommendations: List[str]
+    confidence_score: float
+
+class _BatchAnalysisSchema(TypedDict):
+    analyses: List[_AnalysisSchema]
+
+class _AnswerSchema(TypedDict):
+    question: str
+    answer: str
+    confidence: float
+    relevant_sections: List[str]
+    recommendations: List[str]
+    sources: List[str]
+
+# Bound simultaneous Gemini calls to stay within provider QPS limits
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "10"))
+_gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+# Transient Gemini failures are retried with backoff; InvalidArgument (e.g. prompt too long) is not
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "120"))
+_RETRYABLE_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.DeadlineExceeded,
+)
+
+def _extract_json(text: str) -> Any:
+    """Extract the first JSON object from a model response"""
+    text = text.strip()
+    
+    # Fast path: a bare JSON object needs no scanning
+    if text[:1] == '{' and text[-1:] == '}':
+        try:
+            return _loads(text)
+        except json.JSONDecodeError:
+            pass
+    
+    # Brace-balanced scan from the first '{', skipping braces inside strings
+    start = text.find('{')
+    if start != -1:
+        depth = 0
+        in_string = False
+        escape = False
+        for i in range(start, len(text)):
+            char = text[i]
+            if in_string:
+                if escape:
+                    escape = False
+                elif char == '\\':
+                    escape = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    try:
+                        return _loads(text[start:i + 1])
+                    except json.JSONDecodeError:
+                        break
+    
+    # No complete object found; let the parser raise a descriptive error
+    return _loads(text)
+
+def _chunk_text(content: str, max_chars: int = CHUNK_MAX_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split long content into overlapping chunks, preferring paragraph boundaries"""
+    if len(content) <= max_chars:
+        return [content]
+    
+    chunks = []
+    start = 0
+    while True:
+        end = min(start + max_chars, len(content))
+        if end < len(content):
+            boundary = content.rfind("\n\n", start + overlap + 1, end)
+            if boundary != -1:
+                end = boundary
+        chunks.append(content[start:end])
+        if end >= len(content):
+            return chunks
+        start = end - overlap
+
+class _IncrementalJsonParser:
+    """Incrementally parse a streamed JSON object, returning top-level fields as they close"""
+    
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start: Optional[int] = None
+        self._done = False
+    
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk of response text and return newly completed (key, value) pairs"""
+        if self._done:
+            return []
+        
+        completed: List[Tuple[str, Any]] = []
+        text = self._text + chunk
+        i = self._pos
+        
+        # Only scan characters not seen in previous chunks
+        while i < len(text):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = i + 1
+            elif char in '}]' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._parse_member(text[self._member_start:i]))
+                    self._done = True
+                    break
+            elif char == ',' and self._depth == 1:
+                completed.extend(self._parse_member(text[self._member_start:i]))
+                self._member_start = i + 1
+            i += 1
+        
+        # Keep only the unfinished member so the buffer does not grow with the response
+        if self._member_start is None or self._done:
+            self._text = ""
+            self._pos = 0
+        else:
+            self._text = text[self._member_start:]
+            self._pos = i - self._member_start
+            self._member_start = 0
+        
+        return completed
+    
+    def _parse_member(self, segment: str) -> List[Tuple[str, Any]]:
+        """Parse a single '"key": value' member"""
+        segment = segment.strip()
+        if not segment:
+            return []
+        try:
+            return list(_loads("{" + segment + "}").items())
+        except json.JSONDecodeError:
+            return []
 
 class LegalDocumentAI:
     def __init__(self):
@@ -26,144 +357,289 @@ class LegalDocumentAI:
         # Configure the model
         self.model = genai.GenerativeModel(
             model_name="gemini-1.5-flash",
-            generation_config={
-                "temperature": 0.3,
-                "top_p": 0.95,
-                "top_k": 64,
-                "max_output_tokens": 8192,
-            },
-            safety_settings=[
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
+            generation_config=_GEN_CONFIG,
+            safety_settings=_SAFETY_SETTINGS
+        )
+        
+        # Single-purpose models carrying their static instructions as system_instruction
+        self._analysis_model = genai.GenerativeModel(
+            model_name="gemini-1.5-flash",
+            generation_config=_GEN_CONFIG,
+            safety_settings=_SAFETY_SETTINGS,
+            system_instruction=_ANALYZE_SYSTEM
+        )
+        self._qa_model = genai.GenerativeModel(
+            model_name="gemini-1.5-flash",
+            generation_config=_GEN_CONFIG,
+            safety_settings=_SAFETY_SETTINGS,
+            system_instruction=_QUESTION_SYSTEM
         )
+        
+        # Exact-match cache (persisted)
+        self._exact_cache: LRUCache = self._load_cache()
+        self._cache_file_lock = threading.Lock()
+        
+        # Futures for analyses currently in flight, keyed by cache key
+        self._inflight: Dict[str, asyncio.Task] = {}
     
-    async def analyze_document(self, content: str, filename: str) -> Dict[str, Any]:
-        """Analyze a legal document and return structured insights"""
+    async def analyze_document(self, content: str, filename: str, return_bytes: bool = False) -> Union[Dict[str, Any], bytes]:
+        """Analyze a legal document and return structured insights (as JSON bytes if return_bytes)"""
         
-        prompt = f"""
-        You are an expert legal document analyzer. Analyze the following legal document and provide a comprehensive analysis in JSON format.
-
-        Document Filename: {filename}
-        Document Content:
-        {content}
-
-        Please provide your analysis in the following JSON structure:
-        {{
-            "summary": "Brief summary of the document (2-3 sentences)",
-            "document_type": "Type of legal document (e.g., Contract, NDA, Terms of Service, etc.)",
-            "key_clauses": [
-                "List of key clauses identified in the document"
-            ],
-            "risks": [
-                {{
-                    "type": "Risk category (e.g., Compliance Risk, Liability Risk, etc.)",
-                    "level": "Risk level: Low, Medium, High, or Critical",
-                    "description": "Description of the risk",
-                    "recommendation": "Recommended action to mitigate the risk"
-                }}
-            ],
-            "obligations": [
-                {{
-                    "party": "Which party has this obligation",
-                    "description": "Description of the obligation",
-                    "deadline": "Any deadline mentioned (or null if none)"
-                }}
-            ],
-            "overall_risk_score": "Integer from 1-100 representing overall risk",
-            "overall_risk_level": "Overall risk level: Low, Medium, High, or Critical",
-            "compliance_issues": [
-                "List of potential compliance issues identified"
-            ],
-            "recommendations": [
-                "List of actionable recommendations for improving the document"
-            ],
-            "confidence_score": "Float from 0.0-1.0 representing analysis confidence"
-        }}
-
-        Provide only the JSON response, no additional text or explanations.
-        """
+        result = await self._analyze_coalesced(content, filename)
+        return _dumps(result) if return_bytes else result
+    
+    async def _analyze_coalesced(self, content: str, filename: str) -> Dict[str, Any]:
+        """Serve an analysis from cache, an in-flight request, or a new Gemini call"""
+        
+        key = self._cache_key(filename, content)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        # Coalesce concurrent requests for the same document onto one Gemini call. The call
+        # runs as its own task so cancelling any caller, the first included, leaves it
+        # running for the others; each caller gets its own copy of the shared result.
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._analyze_uncached(content, filename, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight_done(key, done))
+        return copy.deepcopy(await asyncio.shield(task))
+    
+    def _inflight_done(self, key: str, task: asyncio.Task) -> None:
+        """Forget a finished in-flight analysis, retrieving its error if every caller left"""
+        
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+    
+    async def _analyze_uncached(self, content: str, filename: str, key: str) -> Dict[str, Any]:
+        """Run the Gemini analysis for a document and cache the result"""
         
         try:
-            response = self.model.generate_content(prompt)
-            
-            # Extract JSON from response
-            response_text = response.text.strip()
-            
-            # Try to find JSON in the response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                analysis_result = json.loads(json_str)
+            chunks = _chunk_text(content)
+            if len(chunks) == 1:
+                analysis_result = await self._analyze_chunk(content, filename)
             else:
-                # Fallback parsing
-                analysis_result = json.loads(response_text)
-            
-            # Validate and ensure required fields exist
-            analysis_result = self._validate_analysis_result(analysis_result)
+                # Analyze long documents chunk-by-chunk in parallel, then merge
+                parts = await asyncio.gather(
+                    *[self._analyze_chunk(chunk, filename, i, len(chunks)) for i, chunk in enumerate(chunks)]
+                )
+                analysis_result = self._reduce_analyses(parts)
             
+            await self._store_cache(key, analysis_result)
             return analysis_result
             
-        except Exception as e:
-            print(f"AI Analysis Error: {str(e)}")
+        except Exception:
+            logger.exception("AI Analysis failed for %s", filename)
             # Return fallback analysis
             return self._get_fallback_analysis(filename)
     
-    async def answer_question(self, document_content: str, question: str, filename: str) -> Dict[str, Any]:
-        """Answer a specific question about the document"""
+    async def _analyze_chunk(self, content: str, filename: str, index: int = 0, total: int = 1) -> Dict[str, Any]:
+        """Analyze a single document (or one chunk of a long document)"""
+        
+        if total > 1:
+            filename = f"{filename} (part {index + 1} of {total})"
+        
+        prompt = self._build_analysis_prompt(content, filename)
+        response = await self._generate_with_retry(
+            self._analysis_model, prompt, generation_config={"response_schema": _AnalysisSchema}
+        )
+        
+        # Structured output guarantees a JSON body; validate to ensure required fields exist
+        return self._validate_analysis_result(_loads(response.text))
+    
+    def _reduce_analyses(self, parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge per-chunk analyses into a single document analysis"""
+        
+        merged = dict(parts[0])
+        merged["summary"] = " ".join(part["summary"] for part in parts)
+        
+        for field in ("risks", "obligations"):
+            merged[field] = [item for part in parts for item in part[field]]
+        
+        for field in ("key_clauses", "compliance_issues", "recommendations"):
+            merged[field] = list(dict.fromkeys(item for part in parts for item in part[field]))
+        
+        merged["overall_risk_score"] = round(sum(part["overall_risk_score"] for part in parts) / len(parts))
+        merged["overall_risk_level"] = max(
+            (part["overall_risk_level"] for part in parts), key=_RISK_LEVELS.index
+        )
+        merged["confidence_score"] = min(part["confidence_score"] for part in parts)
+        
+        return merged
+    
+    async def stream_analysis(self, content: str, filename: str) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield top-level analysis fields as soon as the model finishes generating each one"""
+        
+        key = self._cache_key(filename, content)
+        cached = self._cache_get(key)
+        if cached is not None:
+            for field in cached.items():
+                yield field
+            return
+        
+        # Long documents are chunked, so there is no single response to stream
+        if len(content) > CHUNK_MAX_CHARS:
+            for field in (await self.analyze_document(content, filename)).items():
+                yield field
+            return
+        
+        prompt = self._build_analysis_prompt(content, filename)
+        parser = _IncrementalJsonParser()
+        emitted: Dict[str, Any] = {}
+        
+        # A separate task holds the Gemini slot while draining the response, so a slow or
+        # abandoned consumer never keeps the slot; closing the generator cancels the task
+        chunks: asyncio.Queue = asyncio.Queue()
+        pump = asyncio.create_task(self._pump_stream(prompt, chunks))
+        try:
+            while (text := await chunks.get()) is not None:
+                for field, value in parser.feed(text):
+                    emitted[field] = value
+                    yield field, value
+            await pump
+            
+            # Validate the assembled result and emit any corrected or defaulted fields
+            analysis_result = self._validate_analysis_result(dict(emitted))
+            await self._store_cache(key, analysis_result)
+            
+        except Exception:
+            logger.exception("AI Analysis stream failed for %s", filename)
+            analysis_result = self._get_fallback_analysis(filename)
+        finally:
+            pump.cancel()
+        
+        for field, value in analysis_result.items():
+            if field not in emitted or emitted[field] != value:
+                yield field, value
+    
+    async def _pump_stream(self, prompt: str, chunks: asyncio.Queue) -> None:
+        """Stream a Gemini response into chunks, ending with None even if the call fails"""
+        
+        try:
+            async with _gemini_semaphore:
+                response = await self._analysis_model.generate_content_async(
+                    prompt,
+                    generation_config={"response_schema": _AnalysisSchema},
+                    request_options={"timeout": GEMINI_REQUEST_TIMEOUT},
+                    stream=True
+                )
+                async for chunk in response:
+                    chunks.put_nowait(chunk.text)
+        finally:
+            chunks.put_nowait(None)
+    
+    async def analyze_documents_batch(self, documents: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Analyze several (content, filename) documents using as few model calls as possible"""
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(documents)
+        pending = []
+        for i, (content, filename) in enumerate(documents):
+            cached = self._cache_get(self._cache_key(filename, content))
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+        
+        # Group uncached documents so each prompt stays under the size cap
+        batches: List[List[int]] = []
+        batch_chars = 0
+        for i in pending:
+            size = len(documents[i][0])
+            if batches and len(batches[-1]) < BATCH_MAX_DOCUMENTS and batch_chars + size <= BATCH_MAX_CHARS:
+                batches[-1].append(i)
+                batch_chars += size
+            else:
+                batches.append([i])
+                batch_chars = size
+        
+        batch_results = await asyncio.gather(
+            *[self._analyze_batch([documents[i] for i in batch]) for batch in batches]
+        )
+        for batch, analyses in zip(batches, batch_results):
+            for i, analysis in zip(batch, analyses):
+                results[i] = analysis
+        
+        return results
+    
+    async def _analyze_batch(self, documents: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Analyze a group of documents in a single model call"""
+        
+        if len(documents) == 1:
+            return [await self.analyze_document(*documents[0])]
+        
+        sections = "".join(
+            f"### DOC {i}: {filename}\n{content}\n### END DOC {i}\n\n"
+            for i, (content, filename) in enumerate(documents, 1)
+        )
         
         prompt = f"""
-        You are an expert legal advisor. Based on the following legal document, answer the user's question with accuracy and detail.
-
-        Document: {filename}
-        Document Content:
-        {document_content}
+        You are an expert legal document analyzer. Analyze the following {len(documents)} legal documents independently.
 
-        User Question: {question}
+        {sections}
+        Return a JSON object of the form {{"analyses": [...]}} where "analyses" is an array of exactly {len(documents)} analyses in document order.
+        {_ANALYSIS_GUIDANCE}
 
-        Please provide your answer in JSON format:
-        {{
-            "question": "{question}",
-            "answer": "Detailed answer to the question based on the document",
-            "confidence": "Float from 0.0-1.0 representing confidence in the answer",
-            "relevant_sections": ["List of relevant sections or clauses from the document"],
-            "recommendations": ["Any recommendations related to the question"],
-            "sources": ["Document sections or clauses that support this answer"]
-        }}
-
-        Provide only the JSON response.
+        Provide only the JSON response, no additional text or explanations.
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+            response = await self._generate_with_retry(
+                self.model, prompt, generation_config={"response_schema": _BatchAnalysisSchema}
+            )
+            
+            analyses = _extract_json(response.text).get("analyses")
+            if (not isinstance(analyses, list) or len(analyses) != len(documents)
+                    or not all(isinstance(a, dict) for a in analyses)):
+                raise ValueError(f"Expected {len(documents)} analyses in batch response")
+            
+        except Exception as e:
+            logger.warning("Batch AI Analysis failed, analyzing documents individually: %s", e)
+            # Fall back to analyzing each document on its own
+            return list(await asyncio.gather(
+                *[self.analyze_document(content, filename) for content, filename in documents]
+            ))
+        
+        results = []
+        for (content, filename), analysis in zip(documents, analyses):
+            analysis = self._validate_analysis_result(analysis)
+            await self._store_cache(self._cache_key(filename, content), analysis)
+            results.append(analysis)
+        
+        return results
+    
+    async def answer_question(self, document_content: str, question: str, filename: str,
+                              return_bytes: bool = False) -> Union[Dict[str, Any], bytes]:
+        """Answer a specific question about the document (as JSON bytes if return_bytes)"""
+        
+        result = await self._answer_question(document_content, question, filename)
+        return _dumps(result) if return_bytes else result
+    
+    async def _answer_question(self, document_content: str, question: str, filename: str) -> Dict[str, Any]:
+        """Answer a question from cache or Gemini"""
+        
+        key = self._cache_key(filename, document_content, question)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        prompt = _QUESTION_PREFIX + filename + _QUESTION_MIDDLE + document_content + _QUESTION_ASK + question
+        
+        try:
+            response = await self._generate_with_retry(
+                self._qa_model, prompt, generation_config={"response_schema": _AnswerSchema}
+            )
             
             # Extract JSON
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                result = json.loads(json_str)
-            else:
-                result = json.loads(response_text)
+            result = _extract_json(response.text)
             
+            await self._store_cache(key, result)
             return result
             
-        except Exception as e:
-            print(f"Q&A Error: {str(e)}")
+        except Exception:
+            logger.exception("Q&A failed for %s", filename)
             return {
                 "question": question,
                 "answer": "I apologize, but I'm unable to process your question at this time. Please try rephrasing your question or contact support if the issue persists.",
@@ -173,79 +649,93 @@ class LegalDocumentAI:
                 "sources": []
             }
     
+    @retry(
+        retry=retry_if_exception_type(_RETRYABLE_ERRORS),
+        wait=wait_exponential(multiplier=1, min=1, max=10),
+        stop=stop_after_attempt(3),
+        reraise=True,
+    )
+    async def _generate_with_retry(self, model: Any, prompt: str, **kwargs: Any) -> Any:
+        """Call Gemini under the concurrency limit, retrying transient errors"""
+        async with _gemini_semaphore:
+            return await model.generate_content_async(
+                prompt, request_options={"timeout": GEMINI_REQUEST_TIMEOUT}, **kwargs
+            )
+    
+    def _build_analysis_prompt(self, content: str, filename: str) -> str:
+        """Build the single-document analysis prompt"""
+        return _ANALYZE_PREFIX + filename + _ANALYZE_MIDDLE + content
+    
+    def _cache_key(self, filename: str, content: str, question: str = "") -> str:
+        """Build a namespaced SHA-256 cache key for a request"""
+        return hashlib.sha256("\0".join((CACHE_NAMESPACE, filename, content, question)).encode()).hexdigest()
+    
+    def _load_cache(self) -> LRUCache:
+        """Load the newest persisted cache entries for the current namespace, compacting the file"""
+        cache = LRUCache(maxsize=CACHE_MAX_ENTRIES)
+        lines = 0
+        try:
+            with open(CACHE_PATH, "r", encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        namespace, key, result = _loads(line)
+                    except ValueError:
+                        continue
+                    if namespace == CACHE_NAMESPACE:
+                        cache[key] = result
+        except OSError:
+            return cache
+        
+        # Rewrite the file once stale entries outnumber the live ones
+        if lines > 2 * len(cache):
+            try:
+                tmp_path = CACHE_PATH + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    for key, result in cache.items():
+                        f.write(_dumps([CACHE_NAMESPACE, key, result]) + b"\n")
+                os.replace(tmp_path, CACHE_PATH)
+            except OSError as e:
+                logger.warning("AI cache compaction failed: %s", e)
+        return cache
+    
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of a cached result, so callers can't modify the cache"""
+        cached = self._exact_cache.get(key)
+        return copy.deepcopy(cached) if cached is not None else None
+    
+    async def _store_cache(self, key: str, result: Dict[str, Any]):
+        """Store a copy of a result in the cache and append it to the cache file off the event loop"""
+        self._exact_cache[key] = copy.deepcopy(result)
+        
+        try:
+            await asyncio.to_thread(self._append_cache_line, _dumps([CACHE_NAMESPACE, key, result]) + b"\n")
+        except OSError as e:
+            logger.warning("AI cache persist failed: %s", e)
+    
+    def _append_cache_line(self, line: bytes):
+        """Append one serialized entry to the cache file"""
+        with self._cache_file_lock, open(CACHE_PATH, "ab") as f:
+            f.write(line)
+    
     def _validate_analysis_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """Validate and fill missing fields in analysis result"""
         
-        # Ensure all required fields exist
-        defaults = {
-            "summary": "Document analysis completed",
-            "document_type": "Legal Document",
-            "key_clauses": [],
-            "risks": [],
-            "obligations": [],
-            "overall_risk_score": 50,
-            "overall_risk_level": "Medium",
-            "compliance_issues": [],
-            "recommendations": [],
-            "confidence_score": 0.8
-        }
-        
-        for key, default_value in defaults.items():
-            if key not in result:
+        for key, default_value, is_valid in _SCHEMA:
+            value = result.setdefault(key, list(default_value) if isinstance(default_value, list) else default_value)
+            if is_valid is not None and not is_valid(value):
                 result[key] = default_value
         
-        # Validate risk level
-        if result["overall_risk_level"] not in ["Low", "Medium", "High", "Critical"]:
-            result["overall_risk_level"] = "Medium"
-        
-        # Validate risk score
-        if not isinstance(result["overall_risk_score"], (int, float)) or not (0 <= result["overall_risk_score"] <= 100):
-            result["overall_risk_score"] = 50
-        
-        # Validate confidence score
-        if not isinstance(result["confidence_score"], (int, float)) or not (0 <= result["confidence_score"] <= 1):
-            result["confidence_score"] = 0.8
-        
         return result
     
     def _get_fallback_analysis(self, filename: str) -> Dict[str, Any]:
         """Return a fallback analysis when AI processing fails"""
         
-        return {
-            "summary": f"Analysis of {filename} completed. This document appears to be a standard legal document requiring review.",
-            "document_type": "Legal Document",
-            "key_clauses": [
-                "Standard legal clauses identified",
-                "Terms and conditions section",
-                "Rights and obligations outlined"
-            ],
-            "risks": [
-                {
-                    "type": "General Risk",
-                    "level": "Medium",
-                    "description": "Standard legal risks associated with this document type",
-                    "recommendation": "Review with legal counsel for specific requirements"
-                }
-            ],
-            "obligations": [
-                {
-                    "party": "All parties",
-                    "description": "Standard legal obligations apply",
-                    "deadline": None
-                }
-            ],
-            "overall_risk_score": 50,
-            "overall_risk_level": "Medium",
-            "compliance_issues": [
-                "Recommend compliance review with current regulations"
-            ],
-            "recommendations": [
-                "Review document with qualified legal counsel",
-                "Ensure all parties understand their obligations",
-                "Verify compliance with applicable laws and regulations"
-            ],
-            "confidence_score": 0.6
-        }
+        result = copy.deepcopy(_FALLBACK_TEMPLATE)
+        result["summary"] = f"Analysis of {filename} completed. This document appears to be a standard legal document requiring review."
+        return result
 
-# Global instance
-ai_service = LegalDocumentAI()
+# Lazily created shared instance; configuring Gemini is deferred to first use
+@functools.lru_cache(maxsize=1)
+def get_ai_service() -> LegalDocumentAI:
+    return LegalDocumentAI()
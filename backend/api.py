@@ -3,23 +3,35 @@
 Enhanced Legal Document Analyzer API with Full AI Integration
 """
 
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, Depends, Security, File, UploadFile, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse, FileResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import ORJSONResponse, FileResponse, Response
+from pydantic import BaseModel, ConfigDict, Field
 import jwt
-from datetime import datetime, timedelta
+import orjson
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
+from cachetools import TTLCache
+from datetime import datetime
 import os
 import uuid
+import time
+import hashlib
+import hmac
+import secrets
+import base64
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
 from pathlib import Path
-from dataclasses import asdict
+from dataclasses import asdict, dataclass
 import tempfile
 
+from storage import create_storage
+
 # Import our AI services
 from services.workflow_orchestrator import DocumentAnalysisWorkflow, WorkflowResult
 from services.document_analyzer import DocumentAnalyzer, AnalysisResult, UserProfile
@@ -32,7 +44,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Legal Document Analyzer API",
     version="3.0.0",
-    description="Comprehensive AI-powered legal document analysis with privacy-preserving features"
+    description="Comprehensive AI-powered legal document analysis with privacy-preserving features",
+    default_response_class=ORJSONResponse
 )
 
 security = HTTPBearer()
@@ -46,10 +59,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON bodies (analytics, document details, exports)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Configuration
 JWT_SECRET = os.getenv("JWT_SECRET_KEY", "your-secret-key-here-change-in-production")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+JWT_CACHE_TTL_SECONDS = 30
+LOGIN_CACHE_TTL_SECONDS = 60
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024  # 100MB limit
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Uploads wait here until their workflow has read them; files older than
+# STALE_UPLOAD_SECONDS (left behind by a crash or shutdown) are removed at startup
+UPLOAD_TMP_DIR = Path(os.getenv("UPLOAD_TMP_DIR", os.path.join(tempfile.gettempdir(), "legal-analyzer-uploads")))
+STALE_UPLOAD_SECONDS = 3600
+ALLOWED_EXTENSIONS = ('.pdf', '.docx', '.doc', '.txt')
+_ALLOWED_EXTENSION_SET = frozenset(ALLOWED_EXTENSIONS)
+
+# Verified token cache: blake2b(token) -> AuthContext; entries also expire with the token
+_jwt_cache = TTLCache(maxsize=10000, ttl=JWT_CACHE_TTL_SECONDS)
+
+# Argon2 password hashing; successful verifications are cached briefly so login retries are cheap.
+# Cache keys are blake2b digests keyed with a per-process secret and include the stored hash,
+# so a password change invalidates them.
+_password_hasher = PasswordHasher()
+_login_cache = TTLCache(maxsize=10000, ttl=LOGIN_CACHE_TTL_SECONDS)
+_LOGIN_CACHE_KEY = secrets.token_bytes(32)
+
+# HS256 signing state computed once; tokens are signed and verified with hmac directly
+_JWT_KEY = JWT_SECRET.encode()
+_JWT_HEADER_B64 = base64.urlsafe_b64encode(b'{"typ":"JWT","alg":"HS256"}').rstrip(b"=")
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 if not GEMINI_API_KEY:
@@ -57,27 +99,42 @@ if not GEMINI_API_KEY:
 
 # Initialize AI services
 try:
-    workflow_orchestrator = DocumentAnalysisWorkflow(GEMINI_API_KEY) if GEMINI_API_KEY else None
+    # One analyzer (and Gemini client) shared by the Q&A endpoint and every workflow
     document_processor = DocumentProcessor()
     document_analyzer = DocumentAnalyzer(GEMINI_API_KEY) if GEMINI_API_KEY else None
+    workflow_orchestrator = DocumentAnalysisWorkflow(
+        GEMINI_API_KEY,
+        document_analyzer=document_analyzer,
+        document_processor=document_processor
+    ) if GEMINI_API_KEY else None
 except Exception as e:
     logger.error(f"Failed to initialize AI services: {str(e)}")
     workflow_orchestrator = None
     document_processor = DocumentProcessor()  # This should work without API key
     document_analyzer = None
 
+@dataclass
+class AuthContext:
+    """Authenticated user and the verified token payload for a request"""
+    user: Dict[str, Any]
+    payload: Dict[str, Any]
+
 # Pydantic Models
-class LoginRequest(BaseModel):
+class _APIModel(BaseModel):
+    """Immutable request/response model that ignores unknown fields"""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+class LoginRequest(_APIModel):
     email: str
     password: str
 
-class UserRegistrationRequest(BaseModel):
+class UserRegistrationRequest(_APIModel):
     email: str
     password: str
     name: str
     role: str = "user"
 
-class DocumentUploadResponse(BaseModel):
+class DocumentUploadResponse(_APIModel):
     document_id: str
     filename: str
     message: str
@@ -85,7 +142,7 @@ class DocumentUploadResponse(BaseModel):
     file_size: int
     content_type: str
 
-class WorkflowStatusResponse(BaseModel):
+class WorkflowStatusResponse(_APIModel):
     workflow_id: str
     status: str
     progress: float
@@ -95,32 +152,33 @@ class WorkflowStatusResponse(BaseModel):
     start_time: str
     error_message: Optional[str] = None
 
-class DocumentAnalysisRequest(BaseModel):
+class DocumentAnalysisRequest(_APIModel):
     document_id: str
-    analysis_options: Optional[Dict[str, Any]] = {}
+    analysis_options: Optional[Dict[str, Any]] = Field(default_factory=dict)
 
-class QuestionRequest(BaseModel):
+class QuestionRequest(_APIModel):
     document_id: str
     question: str
 
-class UserProfileUpdate(BaseModel):
+class UserProfileUpdate(_APIModel):
     role: Optional[str] = None
     risk_tolerance: Optional[str] = None
     industry: Optional[str] = None
     experience_level: Optional[str] = None
-    preferences: Optional[Dict[str, Any]] = {}
+    preferences: Optional[Dict[str, Any]] = Field(default_factory=dict)
 
-class ExportRequest(BaseModel):
+class ExportRequest(_APIModel):
     document_id: str
     format: str = "pdf"  # pdf, json, txt
-    sections: List[str] = ["summary", "risks", "recommendations"]
+    sections: List[str] = Field(default_factory=lambda: ["summary", "risks", "recommendations"])
 
-# In-memory storage (replace with database in production)
-users_db = {
+# Default accounts seeded into storage. The hashes are precomputed (demo123 / admin123,
+# argon2-cffi default parameters) so importing the API doesn't pay for two argon2 hashes.
+DEFAULT_USERS = {
     "demo@example.com": {
         "user_id": "demo_user",
         "email": "demo@example.com",
-        "password": "demo123",
+        "password_hash": "$argon2id$v=19$m=65536,t=3,p=4$+djBR7BVi8Yr7hWbZLr3pg$KtZXYBBs8ALuFUS2MRzx9EiU5WLt/kZAlEbSkX0HobA",
         "name": "Demo User",
         "role": "user",
         "created_at": "2024-01-01T00:00:00Z",
@@ -133,7 +191,7 @@ users_db = {
     "admin@example.com": {
         "user_id": "admin_user",
         "email": "admin@example.com",
-        "password": "admin123",
+        "password_hash": "$argon2id$v=19$m=65536,t=3,p=4$fl8gCckZvS68WqJB+1sqMQ$L9ejshZW529yk/bBvTAx+5GRYxG2rb2LWz1MU5QY0S8",
         "name": "Admin User",
         "role": "admin",
         "created_at": "2024-01-01T00:00:00Z",
@@ -145,31 +203,115 @@ users_db = {
     }
 }
 
-documents_db = {}
-analysis_results_db = {}
+# Users, documents and analysis results; Redis-backed when REDIS_URL is set so workers share state
+storage = create_storage(DEFAULT_USERS)
+
+@app.on_event("startup")
+async def init_storage():
+    await storage.init()
+
+def _purge_stale_uploads():
+    """Create the upload directory and delete uploads no workflow is going to read"""
+    UPLOAD_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    cutoff = time.time() - STALE_UPLOAD_SECONDS
+    for path in UPLOAD_TMP_DIR.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError as e:
+            logger.warning(f"Could not remove stale upload {path}: {e}")
+
+@app.on_event("startup")
+async def init_upload_dir():
+    await asyncio.to_thread(_purge_stale_uploads)
 
 # Helper Functions
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
-    """Verify JWT token and return user info"""
+_now_iso_cache: Dict[str, Any] = {"second": -1, "value": ""}
+
+def utc_now_iso() -> str:
+    """Current UTC time as an ISO string at second resolution, formatted at most once per second"""
+    second = int(time.time())
+    if second != _now_iso_cache["second"]:
+        _now_iso_cache["value"] = datetime.utcfromtimestamp(second).isoformat()
+        _now_iso_cache["second"] = second
+    return _now_iso_cache["value"]
+
+def _b64url_encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _b64url_decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+def _decode_jwt(token: str) -> Dict[str, Any]:
+    """Verify an HS256 token and return its payload, raising PyJWT's exception types"""
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        signing_input, _, signature = token.encode().rpartition(b".")
+        header_b64, _, payload_b64 = signing_input.partition(b".")
+        if orjson.loads(_b64url_decode(header_b64)).get("alg") != JWT_ALGORITHM:
+            raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+        expected = hmac.new(_JWT_KEY, signing_input, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64url_decode(signature)):
+            raise jwt.InvalidSignatureError("Signature verification failed")
+        payload = orjson.loads(_b64url_decode(payload_b64))
+    except (ValueError, AttributeError, UnicodeError) as e:
+        raise jwt.DecodeError("Invalid token") from e
+    
+    if not isinstance(payload, dict) or not isinstance(payload.get("exp"), int):
+        raise jwt.DecodeError("Invalid token payload")
+    if payload["exp"] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
+async def get_auth_context(credentials: HTTPAuthorizationCredentials = Security(security)) -> AuthContext:
+    """Verify JWT token and return the user together with the decoded payload"""
+    try:
+        # Serve recently verified tokens from cache, keyed on a hash of the token
+        cache_key = hashlib.blake2b(credentials.credentials.encode(), digest_size=16).digest()
+        cached = _jwt_cache.get(cache_key)
+        if cached is not None and cached.payload["exp"] > time.time():
+            return cached
+        
+        payload = _decode_jwt(credentials.credentials)
         user_id = payload.get("user_id")
         
         # Find user in database
-        user = next((u for u in users_db.values() if u["user_id"] == user_id), None)
+        user = await storage.get_user(user_id)
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         
-        return user
+        auth = AuthContext(user=user, payload=payload)
+        _jwt_cache[cache_key] = auth
+        return auth
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def verify_token(auth: AuthContext = Depends(get_auth_context, use_cache=True)) -> Dict[str, Any]:
+    """Verify JWT token and return user info"""
+    return auth.user
+
+async def verify_password(user: Dict[str, Any], password: str) -> bool:
+    """Check a password against the user's argon2 hash without blocking the event loop"""
+    cache_key = hashlib.blake2b(
+        "\0".join((user["user_id"], user["password_hash"], password)).encode(),
+        key=_LOGIN_CACHE_KEY,
+        digest_size=16
+    ).digest()
+    if cache_key in _login_cache:
+        return True
+    
+    try:
+        await asyncio.to_thread(_password_hasher.verify, user["password_hash"], password)
+    except (VerifyMismatchError, InvalidHashError):
+        return False
+    
+    _login_cache[cache_key] = True
+    return True
+
 def create_jwt_token(user: Dict[str, Any]) -> str:
     """Create JWT token for user"""
-    now = datetime.utcnow()
-    expiration = now + timedelta(hours=JWT_EXPIRATION_HOURS)
+    now = int(time.time())
     
     payload = {
         "user_id": user["user_id"],
@@ -177,10 +319,27 @@ def create_jwt_token(user: Dict[str, Any]) -> str:
         "role": user["role"],
         "name": user["name"],
         "iat": now,
-        "exp": expiration
+        "exp": now + JWT_EXPIRATION_HOURS * 3600
     }
     
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    signing_input = _JWT_HEADER_B64 + b"." + _b64url_encode(orjson.dumps(payload))
+    signature = hmac.new(_JWT_KEY, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + _b64url_encode(signature)).decode()
+
+def _public_document(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Document record as returned to clients, without internal (underscore-prefixed) fields"""
+    return {key: value for key, value in doc.items() if not key.startswith("_")}
+
+def _analysis_meta(analysis: Dict[str, Any]) -> Tuple[Optional[str], str]:
+    """Return (overall risk level, file type) for a stored analysis record"""
+    if "risk_level" in analysis:
+        return analysis["risk_level"], analysis["file_type"]
+    
+    # Records stored before the flattened fields were added
+    workflow_result = analysis.get("workflow_result") or {}
+    risk_assessment = (workflow_result.get("analysis_result") or {}).get("risk_assessment") or {}
+    processed_doc = workflow_result.get("processed_document") or {}
+    return risk_assessment.get("overall_risk_level"), processed_doc.get("file_type", "unknown")
 
 def check_ai_availability():
     """Check if AI services are available"""
@@ -192,47 +351,52 @@ def check_ai_availability():
 
 # API Endpoints
 
+# Static and short-lived response bodies, serialized once
+_root_response_body = orjson.dumps({
+    "name": "Legal Document Analyzer API",
+    "version": "3.0.0",
+    "status": "operational",
+    "ai_services": {
+        "workflow_orchestrator": workflow_orchestrator is not None,
+        "document_analyzer": document_analyzer is not None,
+        "document_processor": document_processor is not None
+    },
+    "features": [
+        "Advanced AI Document Analysis",
+        "Privacy-Preserving PII Redaction", 
+        "Real-time Workflow Processing",
+        "Risk Assessment & Classification",
+        "Industry Norm Benchmarking",
+        "Interactive Q&A System",
+        "Comprehensive Reporting",
+        "Role-based User Profiles"
+    ]
+})
+_health_response_cache: Dict[str, Any] = {"body": b"", "expires_at": 0.0}
+HEALTH_CACHE_TTL_SECONDS = 1.0
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
-    return {
-        "name": "Legal Document Analyzer API",
-        "version": "3.0.0",
-        "status": "operational",
-        "ai_services": {
-            "workflow_orchestrator": workflow_orchestrator is not None,
-            "document_analyzer": document_analyzer is not None,
-            "document_processor": document_processor is not None
-        },
-        "features": [
-            "Advanced AI Document Analysis",
-            "Privacy-Preserving PII Redaction", 
-            "Real-time Workflow Processing",
-            "Risk Assessment & Classification",
-            "Industry Norm Benchmarking",
-            "Interactive Q&A System",
-            "Comprehensive Reporting",
-            "Role-based User Profiles"
-        ]
-    }
+    return Response(content=_root_response_body, media_type="application/json")
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    now = time.monotonic()
+    if now < _health_response_cache["expires_at"]:
+        return Response(content=_health_response_cache["body"], media_type="application/json")
+    
     health_status = {
         "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": utc_now_iso(),
         "services": {
             "api": "operational",
             "document_processor": "operational",
             "workflow_orchestrator": "operational" if workflow_orchestrator else "unavailable",
             "ai_analyzer": "operational" if document_analyzer else "unavailable"
         },
-        "database": {
-            "users": len(users_db),
-            "documents": len(documents_db),
-            "analysis_results": len(analysis_results_db)
-        }
+        "database": await storage.counts()
     }
     
     overall_health = all(
@@ -243,21 +407,24 @@ async def health_check():
     if not overall_health:
         health_status["status"] = "degraded"
     
-    return health_status
+    body = orjson.dumps(health_status)
+    _health_response_cache["body"] = body
+    _health_response_cache["expires_at"] = now + HEALTH_CACHE_TTL_SECONDS
+    return Response(content=body, media_type="application/json")
 
 # Authentication Endpoints
 
 @app.post("/auth/login")
 async def login(credentials: LoginRequest):
     """User login with JWT token generation"""
-    user = users_db.get(credentials.email)
+    user = await storage.get_user_by_email(credentials.email)
     
-    if not user or user["password"] != credentials.password:
+    if not user or not await verify_password(user, credentials.password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     token = create_jwt_token(user)
     
-    return {
+    return ORJSONResponse({
         "access_token": token,
         "token_type": "bearer",
         "expires_in": JWT_EXPIRATION_HOURS * 3600,
@@ -268,22 +435,22 @@ async def login(credentials: LoginRequest):
             "role": user["role"],
             "profile": user.get("profile", {})
         }
-    }
+    })
 
 @app.post("/auth/register")
 async def register(registration: UserRegistrationRequest):
     """User registration"""
-    if registration.email in users_db:
+    if await storage.get_user_by_email(registration.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     user_id = str(uuid.uuid4())
     user_data = {
         "user_id": user_id,
         "email": registration.email,
-        "password": registration.password,
+        "password_hash": await asyncio.to_thread(_password_hasher.hash, registration.password),
         "name": registration.name,
         "role": registration.role,
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": utc_now_iso(),
         "profile": {
             "risk_tolerance": "medium",
             "industry": "general",
@@ -291,10 +458,10 @@ async def register(registration: UserRegistrationRequest):
         }
     }
     
-    users_db[registration.email] = user_data
+    await storage.save_user(user_data)
     token = create_jwt_token(user_data)
     
-    return {
+    return ORJSONResponse({
         "message": "Registration successful",
         "access_token": token,
         "token_type": "bearer",
@@ -306,19 +473,19 @@ async def register(registration: UserRegistrationRequest):
             "role": user_data["role"],
             "profile": user_data["profile"]
         }
-    }
+    })
 
 @app.get("/auth/profile")
 async def get_user_profile(current_user: Dict[str, Any] = Depends(verify_token)):
     """Get user profile"""
-    return {
+    return ORJSONResponse({
         "user_id": current_user["user_id"],
         "email": current_user["email"],
         "name": current_user["name"],
         "role": current_user["role"],
         "profile": current_user.get("profile", {}),
         "created_at": current_user.get("created_at")
-    }
+    })
 
 @app.put("/auth/profile")
 async def update_user_profile(
@@ -326,8 +493,7 @@ async def update_user_profile(
     current_user: Dict[str, Any] = Depends(verify_token)
 ):
     """Update user profile"""
-    user_email = current_user["email"]
-    user = users_db[user_email]
+    user = await storage.get_user_by_email(current_user["email"])
     
     if profile_update.role is not None:
         user["role"] = profile_update.role
@@ -345,13 +511,14 @@ async def update_user_profile(
     if profile_update.preferences:
         user["profile"]["preferences"] = profile_update.preferences
     
-    return {"message": "Profile updated successfully", "profile": user["profile"]}
+    await storage.save_user(user)
+    
+    return ORJSONResponse({"message": "Profile updated successfully", "profile": user["profile"]})
 
 # Document Management Endpoints
 
 @app.post("/documents/upload")
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     redaction_level: str = Query("partial", regex="^(none|partial|full)$"),
     analysis_depth: str = Query("comprehensive", regex="^(basic|standard|comprehensive)$"),
@@ -364,19 +531,32 @@ async def upload_document(
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
     
-    allowed_extensions = ['.pdf', '.docx', '.doc', '.txt']
-    if not any(file.filename.lower().endswith(ext) for ext in allowed_extensions):
+    if os.path.splitext(file.filename)[1].lower() not in _ALLOWED_EXTENSION_SET:
         raise HTTPException(
             status_code=400, 
-            detail=f"Unsupported file type. Allowed: {', '.join(allowed_extensions)}"
+            detail=f"Unsupported file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # Read and validate file content
-    content = await file.read()
-    if len(content) > 100 * 1024 * 1024:  # 100MB limit
-        raise HTTPException(status_code=413, detail="File too large. Maximum size: 100MB")
-    
-    if len(content) == 0:
+    # Stream the upload to a temporary file instead of buffering it in memory; disk
+    # writes run in a worker thread so a slow disk does not stall the event loop
+    file_size = 0
+    with tempfile.NamedTemporaryFile(delete=False, dir=UPLOAD_TMP_DIR, prefix="upload_", suffix=Path(file.filename).suffix) as tmp:
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                if file_size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(status_code=413, detail="File too large. Maximum size: 100MB")
+                await asyncio.to_thread(tmp.write, chunk)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+        finally:
+            # Release Starlette's spooled copy now rather than at the end of the request
+            await file.close()
+    
+    if file_size == 0:
+        os.unlink(tmp.name)
         raise HTTPException(status_code=400, detail="File is empty")
     
     # Generate document ID
@@ -386,18 +566,19 @@ async def upload_document(
     document_record = {
         "document_id": document_id,
         "filename": file.filename,
-        "file_size": len(content),
+        "_filename_lc": file.filename.lower(),  # precomputed for search
+        "file_size": file_size,
         "content_type": file.content_type or "application/octet-stream",
-        "upload_timestamp": datetime.utcnow().isoformat(),
+        "upload_timestamp": utc_now_iso(),
         "user_id": current_user["user_id"],
         "status": "uploaded",
         "redaction_level": redaction_level,
         "analysis_depth": analysis_depth
     }
     
-    documents_db[document_id] = document_record
+    await storage.save_document(document_record)
     
-    # Start background analysis
+    # Queue background analysis
     workflow_options = {
         "redaction_level": redaction_level,
         "analysis_depth": analysis_depth,
@@ -406,27 +587,66 @@ async def upload_document(
     
     user_profile = current_user.get("profile", {})
     
-    background_tasks.add_task(
-        process_document_workflow,
-        document_id,
-        content,
-        file.filename,
-        user_profile,
-        workflow_options
-    )
+    try:
+        enqueue_workflow(document_id, tmp.name, file.filename, user_profile, workflow_options)
+    except HTTPException:
+        await storage.delete_document(document_record)
+        os.unlink(tmp.name)
+        raise
     
     return DocumentUploadResponse(
         document_id=document_id,
         filename=file.filename,
         message="Document uploaded successfully. AI analysis started.",
         workflow_id="",  # Will be updated when workflow starts
-        file_size=len(content),
+        file_size=file_size,
         content_type=document_record["content_type"]
     )
 
+# Bounded queue of pending workflows drained by a fixed pool of workers
+WORKFLOW_QUEUE_SIZE = int(os.getenv("WORKFLOW_QUEUE_SIZE", "256"))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+_workflow_queue: Optional[asyncio.Queue] = None
+_workflow_workers: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_workflow_workers():
+    global _workflow_queue
+    _workflow_queue = asyncio.Queue(maxsize=WORKFLOW_QUEUE_SIZE)
+    _workflow_workers.extend(asyncio.create_task(_workflow_worker()) for _ in range(UPLOAD_WORKERS))
+
+@app.on_event("shutdown")
+async def stop_workflow_workers():
+    for worker in _workflow_workers:
+        worker.cancel()
+    await asyncio.gather(*_workflow_workers, return_exceptions=True)
+    _workflow_workers.clear()
+
+async def _workflow_worker():
+    """Run queued workflows one at a time"""
+    while True:
+        job = await _workflow_queue.get()
+        try:
+            await process_document_workflow(*job)
+        finally:
+            _workflow_queue.task_done()
+
+def enqueue_workflow(
+    document_id: str,
+    file_path: str,
+    filename: str,
+    user_profile: Dict[str, Any],
+    workflow_options: Dict[str, Any]
+):
+    """Queue a document for analysis, rejecting it when the queue is full"""
+    try:
+        _workflow_queue.put_nowait((document_id, file_path, filename, user_profile, workflow_options))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Analysis queue is full. Please try again shortly.")
+
 async def process_document_workflow(
     document_id: str,
-    file_content: bytes,
+    file_path: str,
     filename: str,
     user_profile: Dict[str, Any],
     workflow_options: Dict[str, Any]
@@ -435,6 +655,8 @@ async def process_document_workflow(
     try:
         logger.info(f"Starting workflow for document {document_id}")
         
+        file_content = await asyncio.to_thread(Path(file_path).read_bytes)
+        
         # Execute the complete workflow
         workflow_result = await workflow_orchestrator.execute_workflow(
             file_content=file_content,
@@ -443,23 +665,34 @@ async def process_document_workflow(
             workflow_options=workflow_options
         )
         
-        # Update document record
-        documents_db[document_id]["workflow_id"] = workflow_result.workflow_id
-        documents_db[document_id]["status"] = "completed"
-        
-        # Store analysis results
-        analysis_results_db[document_id] = {
-            "document_id": document_id,
-            "workflow_result": workflow_orchestrator.to_dict(workflow_result),
-            "created_at": datetime.utcnow().isoformat()
-        }
+        # Store analysis results and mark the document completed in one step, only if the
+        # document was not deleted while it was queued or being analyzed
+        workflow_dict = workflow_orchestrator.to_dict(workflow_result)
+        risk_level, file_type = _analysis_meta({"workflow_result": workflow_dict})
+        saved = await storage.update_document(
+            document_id,
+            {"workflow_id": workflow_result.workflow_id, "status": "completed"},
+            analysis={
+                "document_id": document_id,
+                "workflow_result": workflow_dict,
+                "created_at": utc_now_iso(),
+                # Flattened fields read by the analytics endpoints
+                "risk_level": risk_level,
+                "file_type": file_type
+            }
+        )
         
-        logger.info(f"Workflow completed for document {document_id}")
+        if saved:
+            logger.info(f"Workflow completed for document {document_id}")
+        else:
+            logger.info(f"Document {document_id} was deleted during its workflow, discarding the analysis")
         
     except Exception as e:
         logger.error(f"Workflow failed for document {document_id}: {str(e)}")
-        documents_db[document_id]["status"] = "failed"
-        documents_db[document_id]["error_message"] = str(e)
+        await storage.update_document(document_id, {"status": "failed", "error_message": str(e)})
+    finally:
+        # The upload is only needed until its workflow has run
+        Path(file_path).unlink(missing_ok=True)
 
 @app.get("/documents")
 async def get_documents(
@@ -470,38 +703,43 @@ async def get_documents(
     current_user: Dict[str, Any] = Depends(verify_token)
 ):
     """Get user documents with pagination and filtering"""
-    # Filter documents by user
-    user_docs = [
-        doc for doc in documents_db.values()
-        if doc["user_id"] == current_user["user_id"]
-    ]
+    # Unfiltered pages come straight from the time-ordered index without loading every document
+    if not search and not status:
+        total = await storage.count_documents(current_user["user_id"])
+        return ORJSONResponse({
+            "documents": [_public_document(doc) for doc in await storage.list_documents(current_user["user_id"], offset, limit)],
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "has_more": offset + limit < total
+        })
+    
+    # Look up the user's documents, newest first
+    user_docs = await storage.list_documents(current_user["user_id"])
     
     # Apply search filter
     if search:
         search_lower = search.lower()
         user_docs = [
             doc for doc in user_docs
-            if search_lower in doc["filename"].lower()
+            if search_lower in (doc.get("_filename_lc") or doc["filename"].lower())
         ]
     
     # Apply status filter
     if status:
         user_docs = [doc for doc in user_docs if doc["status"] == status]
     
-    # Sort by upload time (newest first)
-    user_docs.sort(key=lambda x: x["upload_timestamp"], reverse=True)
-    
     # Apply pagination
     total = len(user_docs)
     paginated_docs = user_docs[offset:offset + limit]
     
-    return {
-        "documents": paginated_docs,
+    return ORJSONResponse({
+        "documents": [_public_document(doc) for doc in paginated_docs],
         "total": total,
         "offset": offset,
         "limit": limit,
         "has_more": offset + limit < total
-    }
+    })
 
 @app.get("/documents/{document_id}")
 async def get_document_details(
@@ -509,20 +747,20 @@ async def get_document_details(
     current_user: Dict[str, Any] = Depends(verify_token)
 ):
     """Get detailed document information"""
-    if document_id not in documents_db:
+    doc = await storage.get_document(document_id)
+    if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc = documents_db[document_id]
     if doc["user_id"] != current_user["user_id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Include analysis results if available
-    analysis_results = analysis_results_db.get(document_id)
+    analysis_results = await storage.get_analysis(document_id)
     
-    return {
-        "document": doc,
+    return ORJSONResponse({
+        "document": _public_document(doc),
         "analysis_results": analysis_results["workflow_result"] if analysis_results else None
-    }
+    })
 
 @app.delete("/documents/{document_id}")
 async def delete_document(
@@ -530,24 +768,22 @@ async def delete_document(
     current_user: Dict[str, Any] = Depends(verify_token)
 ):
     """Delete a document and its analysis results"""
-    if document_id not in documents_db:
+    doc = await storage.get_document(document_id)
+    if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc = documents_db[document_id]
     if doc["user_id"] != current_user["user_id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Delete document and analysis results
-    del documents_db[document_id]
-    if document_id in analysis_results_db:
-        del analysis_results_db[document_id]
+    await storage.delete_document(doc)
     
     # Cancel workflow if running
     workflow_id = doc.get("workflow_id")
     if workflow_id and workflow_orchestrator:
         await workflow_orchestrator.cancel_workflow(workflow_id)
     
-    return {"message": "Document deleted successfully"}
+    return ORJSONResponse({"message": "Document deleted successfully"})
 
 # Workflow Management Endpoints
 
@@ -563,7 +799,7 @@ async def get_workflow_status(
     if not status:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
-    return status
+    return ORJSONResponse(status)
 
 @app.post("/workflows/{workflow_id}/cancel")
 async def cancel_workflow(
@@ -577,7 +813,7 @@ async def cancel_workflow(
     if not success:
         raise HTTPException(status_code=404, detail="Workflow not found or already completed")
     
-    return {"message": "Workflow cancelled successfully"}
+    return ORJSONResponse({"message": "Workflow cancelled successfully"})
 
 # Analysis and Q&A Endpoints
 
@@ -590,15 +826,15 @@ async def ask_question(
     """Ask a question about a specific document"""
     check_ai_availability()
     
-    if document_id not in documents_db:
+    doc = await storage.get_document(document_id)
+    if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc = documents_db[document_id]
     if doc["user_id"] != current_user["user_id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Get analysis results
-    analysis_results = analysis_results_db.get(document_id)
+    analysis_results = await storage.get_analysis(document_id)
     if not analysis_results:
         raise HTTPException(status_code=400, detail="Document analysis not completed")
     
@@ -619,12 +855,12 @@ async def ask_question(
             analysis_result
         )
         
-        return {
+        return ORJSONResponse({
             "question": question_request.question,
             "answer": answer,
             "document_id": document_id,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+            "timestamp": utc_now_iso()
+        })
     except Exception as e:
         logger.error(f"Question answering failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to process question")
@@ -632,26 +868,25 @@ async def ask_question(
 @app.post("/documents/{document_id}/reanalyze")
 async def reanalyze_document(
     document_id: str,
-    background_tasks: BackgroundTasks,
     analysis_request: Optional[DocumentAnalysisRequest] = None,
     current_user: Dict[str, Any] = Depends(verify_token)
 ):
     """Re-analyze a document with updated options"""
     check_ai_availability()
     
-    if document_id not in documents_db:
+    doc = await storage.get_document(document_id)
+    if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc = documents_db[document_id]
     if doc["user_id"] != current_user["user_id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # For now, return message that reanalysis would require stored file content
     # In production, you would store the file content or retrieve it from storage
-    return {
+    return ORJSONResponse({
         "message": "Reanalysis feature requires file content storage. Please re-upload the document.",
         "document_id": document_id
-    }
+    })
 
 # Analytics and Reporting Endpoints
 
@@ -660,11 +895,8 @@ async def get_dashboard_analytics(
     current_user: Dict[str, Any] = Depends(verify_token)
 ):
     """Get dashboard analytics data"""
-    user_docs = [doc for doc in documents_db.values() if doc["user_id"] == current_user["user_id"]]
-    user_analyses = [res for res in analysis_results_db.values() 
-                    if any(doc["document_id"] == res["document_id"] and 
-                          doc["user_id"] == current_user["user_id"] 
-                          for doc in documents_db.values())]
+    user_docs = await storage.list_documents(current_user["user_id"])
+    user_analyses = await storage.list_analyses([doc["document_id"] for doc in user_docs])
     
     # Calculate statistics
     total_documents = len(user_docs)
@@ -674,17 +906,14 @@ async def get_dashboard_analytics(
     # Risk distribution from analysis results
     risk_counts = {"Low": 0, "Medium": 0, "High": 0, "Critical": 0}
     for analysis in user_analyses:
-        workflow_result = analysis.get("workflow_result", {})
-        analysis_result = workflow_result.get("analysis_result", {})
-        risk_assessment = analysis_result.get("risk_assessment", {})
-        overall_risk = risk_assessment.get("overall_risk_level", "Medium")
+        overall_risk = _analysis_meta(analysis)[0] or "Medium"
         if overall_risk in risk_counts:
             risk_counts[overall_risk] += 1
     
     # Recent documents
-    recent_docs = sorted(user_docs, key=lambda x: x["upload_timestamp"], reverse=True)[:5]
+    recent_docs = [_public_document(doc) for doc in user_docs[:5]]
     
-    return {
+    return ORJSONResponse({
         "total_documents": total_documents,
         "completed_analyses": completed_analyses,
         "processing_documents": processing_docs,
@@ -701,26 +930,24 @@ async def get_dashboard_analytics(
             "ai_services": "operational" if workflow_orchestrator else "degraded",
             "processing_queue": processing_docs
         }
-    }
+    })
 
 @app.get("/analytics/detailed")
 async def get_detailed_analytics(
     current_user: Dict[str, Any] = Depends(verify_token)
 ):
     """Get detailed analytics for the Analytics page"""
-    user_docs = [doc for doc in documents_db.values() if doc["user_id"] == current_user["user_id"]]
-    user_analyses = [res for res in analysis_results_db.values() 
-                    if any(doc["document_id"] == res["document_id"] and 
-                          doc["user_id"] == current_user["user_id"] 
-                          for doc in documents_db.values())]
+    user_docs = await storage.list_documents(current_user["user_id"])
+    user_analyses = await storage.list_analyses([doc["document_id"] for doc in user_docs])
     
-    # Document type distribution
+    # Document type and risk distribution in a single pass
     doc_types = {}
+    risk_counts = {"Low": 0, "Medium": 0, "High": 0, "Critical": 0}
     for analysis in user_analyses:
-        workflow_result = analysis.get("workflow_result", {})
-        processed_doc = workflow_result.get("processed_document", {})
-        file_type = processed_doc.get("file_type", "unknown")
+        risk_level, file_type = _analysis_meta(analysis)
         doc_types[file_type] = doc_types.get(file_type, 0) + 1
+        if risk_level in risk_counts:
+            risk_counts[risk_level] += 1
     
     # Monthly trends (mock data for demo)
     monthly_trends = [
@@ -732,7 +959,7 @@ async def get_detailed_analytics(
         {"month": "Jun", "documents": len(user_docs), "risks": len(user_analyses)}
     ]
     
-    return {
+    return ORJSONResponse({
         "documents_processed": len(user_docs),
         "success_rate": (len(user_analyses) / max(len(user_docs), 1)) * 100,
         "average_processing_time": 2.3,  # Mock value
@@ -741,17 +968,8 @@ async def get_detailed_analytics(
             for doc_type, count in doc_types.items()
         ],
         "monthly_trends": monthly_trends,
-        "risk_distribution": {
-            "Low": sum(1 for a in user_analyses 
-                      if a.get("workflow_result", {}).get("analysis_result", {}).get("risk_assessment", {}).get("overall_risk_level") == "Low"),
-            "Medium": sum(1 for a in user_analyses 
-                         if a.get("workflow_result", {}).get("analysis_result", {}).get("risk_assessment", {}).get("overall_risk_level") == "Medium"),
-            "High": sum(1 for a in user_analyses 
-                       if a.get("workflow_result", {}).get("analysis_result", {}).get("risk_assessment", {}).get("overall_risk_level") == "High"),
-            "Critical": sum(1 for a in user_analyses 
-                           if a.get("workflow_result", {}).get("analysis_result", {}).get("risk_assessment", {}).get("overall_risk_level") == "Critical")
-        }
-    }
+        "risk_distribution": risk_counts
+    })
 
 # Export Endpoints
 
@@ -762,19 +980,19 @@ async def export_analysis(
     current_user: Dict[str, Any] = Depends(verify_token)
 ):
     """Export analysis results in various formats"""
-    if document_id not in documents_db:
+    doc = await storage.get_document(document_id)
+    if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc = documents_db[document_id]
     if doc["user_id"] != current_user["user_id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    analysis_results = analysis_results_db.get(document_id)
+    analysis_results = await storage.get_analysis(document_id)
     if not analysis_results:
         raise HTTPException(status_code=400, detail="No analysis results available")
     
     if export_request.format == "json":
-        return JSONResponse(
+        return ORJSONResponse(
             content=analysis_results["workflow_result"],
             headers={
                 "Content-Disposition": f"attachment; filename={doc['filename']}_analysis.json"
@@ -801,7 +1019,7 @@ async def export_analysis(
         
         report_content = "\n".join(report_lines)
         
-        return JSONResponse(
+        return ORJSONResponse(
             content={"report": report_content},
             headers={
                 "Content-Disposition": f"attachment; filename={doc['filename']}_analysis.txt"
@@ -824,7 +1042,7 @@ async def cleanup_system(
     if workflow_orchestrator:
         workflow_orchestrator.cleanup_completed_workflows(max_age_hours=24)
     
-    return {"message": "System cleanup completed"}
+    return ORJSONResponse({"message": "System cleanup completed"})
 
 @app.get("/system/stats")
 async def get_system_stats(
@@ -834,19 +1052,27 @@ async def get_system_stats(
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    return {
-        "total_users": len(users_db),
-        "total_documents": len(documents_db),
-        "total_analyses": len(analysis_results_db),
+    counts = await storage.counts()
+    
+    return ORJSONResponse({
+        "total_users": counts["users"],
+        "total_documents": counts["documents"],
+        "total_analyses": counts["analysis_results"],
         "active_workflows": len(workflow_orchestrator.active_workflows) if workflow_orchestrator else 0,
         "ai_services": {
             "workflow_orchestrator": workflow_orchestrator is not None,
             "document_analyzer": document_analyzer is not None,
             "document_processor": True
         }
-    }
+    })
 
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting Legal Document Analyzer API v3.0.0")
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
+    uvicorn.run(
+        "api:app",
+        host="0.0.0.0",
+        port=8001,
+        log_level="info",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
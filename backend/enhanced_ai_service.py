@@ -7,17 +7,363 @@ Integrates Google Gemini with MCP Server functionality
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
-from typing import Dict, List, Any
+from google.api_core import exceptions as google_exceptions
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from typing import Callable, Dict, List, Any, Optional, Tuple
 import json
 import re
 import asyncio
-from datetime import datetime
+import copy
+import hashlib
+import functools
+import itertools
+import time
+from collections import deque
+from datetime import datetime, timezone
+from cachetools import TTLCache
+
+# orjson is optional; its JSONDecodeError subclasses json.JSONDecodeError
+try:
+    import orjson
+    _loads = orjson.loads
+    
+    def _dumps(obj: Any, indent: bool = False) -> str:
+        """Serialize obj to a JSON string for prompt construction"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+except ImportError:
+    orjson = None
+    _loads = json.loads
+    
+    def _dumps(obj: Any, indent: bool = False) -> str:
+        """Serialize obj to a JSON string for prompt construction"""
+        return json.dumps(obj, indent=2 if indent else None)
 # Import mcp_server - will be imported after initialization
 mcp_server = None
 
 # Load environment variables
 load_dotenv()
 
+# Bound simultaneous Gemini calls and retry rate limits with jittered exponential backoff
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "20"))
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "120"))
+_gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+_RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+)
+
+# Optional tokens-per-minute ceiling (0 disables); prompts are estimated at 4 chars per token
+GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", "0"))
+
+class _TokenBudget:
+    """Rolling one-minute budget of approximate prompt tokens"""
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._spent: deque = deque()
+        self._total = 0
+    
+    async def reserve(self, tokens: int):
+        """Wait until tokens fit in the current window, then record them"""
+        if not self.limit:
+            return
+        tokens = min(tokens, self.limit)
+        while True:
+            now = time.monotonic()
+            while self._spent and now - self._spent[0][0] >= 60:
+                self._total -= self._spent.popleft()[1]
+            if self._total + tokens <= self.limit:
+                self._spent.append((now, tokens))
+                self._total += tokens
+                return
+            await asyncio.sleep(60 - (now - self._spent[0][0]))
+
+_token_budget = _TokenBudget(GEMINI_TPM_LIMIT)
+
+_gemini_retry = retry(
+    retry=retry_if_exception_type(_RETRYABLE_ERRORS),
+    wait=wait_exponential_jitter(initial=1, max=10),
+    stop=stop_after_attempt(3),
+    reraise=True,
+)
+
+# LLM response cache; bump PROMPT_VERSION whenever a prompt template changes
+PROMPT_VERSION = "enhanced-v4"
+LLM_CACHE_SIZE = 1024
+LLM_CACHE_TTL_SECONDS = 7 * 86400
+
+# Legal norm searches cached by normalized query
+NORMS_CACHE_SIZE = 1024
+NORMS_CACHE_TTL_SECONDS = 3600
+
+# Upper bound on the concurrent MCP lookups that run before the AI analysis
+MCP_TIMEOUT_SECONDS = float(os.getenv("MCP_TIMEOUT_SECONDS", "10"))
+
+# Document types the analysis prompt may return
+DOCUMENT_TYPES = (
+    'contract', 'privacy_policy', 'terms_of_service',
+    'employment_agreement', 'intellectual_property',
+    'compliance_document', 'nda', 'other'
+)
+
+_VALID_DOC_TYPES = frozenset(DOCUMENT_TYPES)
+
+# Defaults for fields missing from a Gemini analysis. Shared between results,
+# so sequences are tuples and nothing here may be mutated.
+_ANALYSIS_DEFAULTS = {
+    "summary": "Enhanced document analysis completed",
+    "document_type": "Legal Document",
+    "key_clauses": (),
+    "risks": (),
+    "obligations": (),
+    "overall_risk_score": 50,
+    "overall_risk_level": "Medium",
+    "compliance_issues": (),
+    "recommendations": (),
+    "confidence_score": 0.8,
+    "structure_analysis": {
+        "completeness_score": 0,
+        "missing_sections": (),
+        "structural_recommendations": ()
+    },
+    "regulatory_compliance": {
+        "applicable_laws": (),
+        "compliance_gaps": (),
+        "required_clauses_status": "Not analyzed"
+    }
+}
+
+_NESTED_ANALYSIS_KEYS = ("structure_analysis", "regulatory_compliance")
+
+# Static parts of the degraded responses; each call only adds the dynamic fields.
+# The analysis templates hold nested dicts, so each result gets a deep copy.
+_FALLBACK_TEMPLATE = {
+    "document_type": "Legal Document",
+    "key_clauses": ("Analysis unavailable - manual review required",),
+    "risks": ({
+        "type": "Analysis Risk",
+        "level": "Medium",
+        "description": "Unable to perform comprehensive analysis",
+        "recommendation": "Manual legal review recommended",
+        "regulatory_basis": "General legal practice"
+    },),
+    "obligations": (),
+    "overall_risk_score": 60,
+    "overall_risk_level": "Medium",
+    "compliance_issues": ("Analysis service unavailable",),
+    "recommendations": (
+        "Conduct manual legal review",
+        "Consult with legal counsel",
+        "Retry analysis when service is available"
+    ),
+    "confidence_score": 0.3,
+    "structure_analysis": {
+        "completeness_score": 0,
+        "missing_sections": (),
+        "structural_recommendations": ("Manual structure review needed",)
+    },
+    "regulatory_compliance": {
+        "applicable_laws": (),
+        "compliance_gaps": ("Unable to assess",),
+        "required_clauses_status": "Analysis unavailable"
+    },
+    "analysis_version": "enhanced_v1.0_fallback",
+    "mcp_integration": {
+        "mcp_enabled": False,
+        "error": "MCP server integration failed"
+    }
+}
+
+_BASIC_ANALYSIS_TEMPLATE = {
+    "key_clauses": ("Standard legal clauses expected",),
+    "risks": ({
+        "type": "General Risk",
+        "level": "Medium",
+        "description": "Standard legal risks for this document type",
+        "recommendation": "Professional legal review recommended",
+        "regulatory_basis": "General legal standards"
+    },),
+    "obligations": (),
+    "overall_risk_score": 50,
+    "overall_risk_level": "Medium",
+    "compliance_issues": ("Detailed compliance review needed",),
+    "recommendations": ("Seek professional legal advice",),
+    "confidence_score": 0.5,
+    "structure_analysis": {
+        "completeness_score": 50,
+        "missing_sections": ("Unable to determine",),
+        "structural_recommendations": ("Manual structure review recommended",)
+    },
+    "regulatory_compliance": {
+        "applicable_laws": ("Standard legal requirements",),
+        "compliance_gaps": ("Detailed review required",),
+        "required_clauses_status": "Manual verification needed"
+    }
+}
+
+_FALLBACK_ANSWER_TEMPLATE = {
+    "answer": "I apologize, but I'm unable to process your question at this time. Please try rephrasing your question or contact support if the issue persists.",
+    "confidence": 0.0,
+    "relevant_sections": (),
+    "recommendations": (),
+    "sources": (),
+    "legal_basis": (),
+    "regulatory_references": (),
+    "risk_considerations": ()
+}
+
+# Static segments of the analysis prompt; only the values between them change per call
+_ANALYSIS_PROMPT_HEAD = """You are an expert legal document analyzer with access to compliance databases and legal norms.
+Analyze the following legal document comprehensively.
+
+Document Information:
+- Filename: """
+
+_ANALYSIS_PROMPT_SCHEMA = """
+
+Provide comprehensive analysis in this JSON format:
+{
+    "summary": "Detailed summary incorporating MCP insights",
+    "document_type": "Exactly one of: """ + ", ".join(DOCUMENT_TYPES) + """",
+    "key_clauses": ["List of important clauses found"],
+    "risks": [
+        {
+            "type": "Risk category",
+            "level": "Low/Medium/High/Critical",
+            "description": "Risk description",
+            "recommendation": "Mitigation strategy",
+            "regulatory_basis": "Which regulation or norm this relates to"
+        }
+    ],
+    "obligations": [
+        {
+            "party": "Which party",
+            "description": "Obligation description",
+            "deadline": "Deadline if any",
+            "compliance_reference": "Related compliance requirement"
+        }
+    ],
+    "overall_risk_score": 50,
+    "overall_risk_level": "Medium",
+    "compliance_issues": ["Issues based on MCP compliance requirements"],
+    "recommendations": ["Enhanced recommendations using MCP insights"],
+    "confidence_score": 0.85,
+    "structure_analysis": {
+        "completeness_score": """
+
+_ANALYSIS_PROMPT_TAIL = """,
+        "compliance_gaps": ["Identified gaps"],
+        "required_clauses_status": "Analysis of required clauses presence"
+    }
+}
+
+Focus on:
+1. Integration of MCP server compliance requirements
+2. Structural completeness based on document type
+3. Regulatory alignment with identified legal norms
+4. Enhanced risk assessment using both AI and MCP insights
+5. Actionable recommendations based on comprehensive analysis
+
+Respond with valid JSON only.
+"""
+
+# Keyword heuristics used to pick document types for speculative MCP lookups
+# before Gemini has classified the document
+_DOC_TYPE_PATTERNS = {
+    'nda': re.compile(r"non-disclosure|confidentiality agreement|\bnda\b", re.IGNORECASE),
+    'privacy_policy': re.compile(r"privacy (?:policy|notice)|personal (?:data|information)|cookies", re.IGNORECASE),
+    'terms_of_service': re.compile(r"terms of (?:service|use)|acceptable use|user account", re.IGNORECASE),
+    'employment_agreement': re.compile(r"employ(?:ee|er|ment)|salary|job title", re.IGNORECASE),
+    'intellectual_property': re.compile(r"intellectual property|patent|trademark|copyright|licen[cs]e", re.IGNORECASE),
+    'compliance_document': re.compile(r"compliance|regulat(?:ion|ory)|audit", re.IGNORECASE),
+    'contract': re.compile(r"agreement|contract|whereas|hereby|parties", re.IGNORECASE)
+}
+
+# Number of candidate types whose MCP context is fetched up front
+SPECULATIVE_DOC_TYPES = 2
+
+# Prompt size caps; long documents keep their opening and closing sections
+PROMPT_MAX_CONTENT_CHARS = int(os.getenv("ENHANCED_PROMPT_MAX_CHARS", "40000"))
+PROMPT_MAX_NORM_CHARS = 500
+PROMPT_MAX_NORMS = 2
+
+# Compliance requirement fields the analysis prompt actually uses
+_PROMPT_REQUIREMENT_KEYS = ('applicable_laws', 'key_clauses_required')
+
+def _truncate_for_prompt(text: str, max_chars: int) -> str:
+    """Cap text at max_chars, keeping the head and tail around a truncation marker"""
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return f"{text[:head]}\n...[truncated {len(text) - max_chars} chars]...\n{text[-tail:]}"
+
+def _norms_for_prompt(legal_norms: Dict[str, Any]) -> str:
+    """Serialize the top legal norm results, each capped in size"""
+    return "\n".join(
+        _truncate_for_prompt(_dumps(norm, indent=True), PROMPT_MAX_NORM_CHARS)
+        for norm in legal_norms.get('results', [])[:PROMPT_MAX_NORMS]
+    ) or "[]"
+
+def _content_hash(content: str) -> str:
+    """SHA-256 of a document, for callers that did not hash it at upload"""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def _parse_json_response(text: str) -> Any:
+    """Parse a model response that should be JSON, tolerating code fences and surrounding prose"""
+    text = text.strip().removeprefix('```json').removesuffix('```').strip()
+    
+    # Fast path: the prompt asks for JSON only, so most responses parse directly
+    try:
+        return _loads(text)
+    except json.JSONDecodeError:
+        pass
+    
+    # Slice from the first '{' to the last '}' rather than scanning with the regex
+    start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        try:
+            return _loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            pass
+    
+    return _loads(text)
+
+class _JsonStreamScanner:
+    """Track brace depth across streamed chunks to find where the first JSON object ends"""
+    
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, text: str) -> int:
+        """Return the index just past the object's closing brace in text, or -1 if it is still open"""
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.started
+            elif ch == '{':
+                self.depth += 1
+                self.started = True
+            elif ch == '}' and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return -1
+
+def _cache_key(*parts: str) -> str:
+    """Build a prompt-versioned cache key"""
+    return hashlib.sha256("\0".join((PROMPT_VERSION,) + parts).encode()).hexdigest()
+
 class EnhancedLegalDocumentAI:
     def __init__(self):
         """Initialize Enhanced Gemini AI service with MCP integration"""
@@ -63,206 +409,249 @@ class EnhancedLegalDocumentAI:
         except ImportError:
             print("Warning: MCP server not available")
             self.mcp_server = None
+        
+        # Completed analyses and answers keyed by prompt version and input hash
+        self._llm_cache: TTLCache = TTLCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL_SECONDS)
+        self._norms_cache: TTLCache = TTLCache(maxsize=NORMS_CACHE_SIZE, ttl=NORMS_CACHE_TTL_SECONDS)
+    
+    async def close(self):
+        """Close the pooled async Gemini channel; call once on application shutdown"""
+        # generate_content_async lazily attaches the SDK's shared grpc_asyncio client
+        async_client = getattr(self.model, "_async_client", None)
+        if async_client is not None:
+            await async_client.transport.close()
+    
+    @_gemini_retry
+    async def _generate(self, prompt: str) -> Any:
+        """Call Gemini within the token budget and concurrency limit, retrying transient errors"""
+        await _token_budget.reserve(len(prompt) // 4)
+        async with _gemini_semaphore:
+            return await self.model.generate_content_async(
+                prompt, request_options={"timeout": GEMINI_REQUEST_TIMEOUT}
+            )
+    
+    @_gemini_retry
+    async def _generate_json_streamed(self, prompt: str) -> Any:
+        """Stream a Gemini response and parse its JSON object as soon as the closing brace arrives"""
+        await _token_budget.reserve(len(prompt) // 4)
+        async with _gemini_semaphore:
+            response = await self.model.generate_content_async(
+                prompt, stream=True, request_options={"timeout": GEMINI_REQUEST_TIMEOUT}
+            )
+            scanner = _JsonStreamScanner()
+            parts = []
+            async for chunk in response:
+                # chunk.text raises on a safety block, failing fast on the first chunk
+                text = chunk.text
+                end = scanner.feed(text)
+                if end != -1:
+                    parts.append(text[:end])
+                    break
+                parts.append(text)
+        
+        return _parse_json_response("".join(parts))
     
-    async def analyze_document(self, content: str, filename: str) -> Dict[str, Any]:
-        """Enhanced document analysis with MCP server integration"""
+    async def analyze_document(self, content: str, filename: str,
+                               on_progress: Optional[Callable[[str], None]] = None,
+                               content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Enhanced document analysis with MCP server integration; on_progress receives each stage name as it starts
+        
+        content_hash is any stable digest of the document (e.g. computed once at upload); without it the content is hashed here.
+        """
+        
+        report = on_progress or (lambda step: None)
+        
+        key = _cache_key("analysis", filename, content_hash or _content_hash(content))
+        cached = self._llm_cache.get(key)
+        if cached is not None:
+            return dict(cached)
         
         try:
-            # Step 1: Classify document type using AI
-            doc_type = await self._classify_document_type(content)
+            # Step 1: Get MCP server insights for the likeliest document types
+            candidates = self._guess_document_types(content)
+            speculative = await asyncio.gather(
+                *(self._gather_mcp_context(content, candidate) for candidate in candidates)
+            )
+            mcp_context = dict(zip(candidates, speculative))
             
-            # Step 2: Get MCP server insights
-            compliance_req = await self.mcp_server.get_compliance_requirements(doc_type)
-            structure_validation = await self.mcp_server.validate_document_structure(content, doc_type)
-            legal_norms = await self.mcp_server.search_legal_norms(doc_type)
+            # Step 2: Enhanced AI analysis with MCP context; Gemini classifies the document in the same call
+            report("Analyzing Content")
+            try:
+                ai_analysis = await self._perform_ai_analysis(
+                    content, filename, candidates[0], *mcp_context[candidates[0]]
+                )
+                cacheable = True
+            except Exception as e:
+                print(f"AI analysis error: {e}")
+                ai_analysis = self._get_basic_ai_analysis(candidates[0], filename)
+                cacheable = False
             
-            # Step 3: Enhanced AI analysis with MCP context
-            ai_analysis = await self._perform_ai_analysis(
-                content, filename, doc_type, 
-                compliance_req, structure_validation, legal_norms
-            )
+            # Step 3: Keep the MCP context matching Gemini's classification, fetching it if the guess missed
+            doc_type = str(ai_analysis.get('document_type', '')).strip().lower()
+            if doc_type not in _VALID_DOC_TYPES:
+                doc_type = candidates[0]
+            ai_analysis['document_type'] = doc_type
             
-            # Step 4: Calculate enhanced risk using MCP server
-            mcp_risk = await self.mcp_server.calculate_risk(ai_analysis)
+            # Step 4: Calculate enhanced risk using MCP server, alongside any missing context lookup
+            report("Identifying Risks")
+            risk_task = asyncio.create_task(self.mcp_server.calculate_risk(ai_analysis))
+            if doc_type not in mcp_context:
+                mcp_context[doc_type] = await self._gather_mcp_context(content, doc_type)
+            compliance_req, structure_validation, legal_norms = mcp_context[doc_type]
+            mcp_risk = await risk_task
             
             # Step 5: Combine all insights
+            report("Generating Insights")
             enhanced_analysis = self._combine_analysis_results(
                 ai_analysis, compliance_req, structure_validation, 
                 legal_norms, mcp_risk, doc_type
             )
             
+            # Only cache complete results so degraded analyses are retried
+            if cacheable and all(r.get('success') for r in (compliance_req, structure_validation, legal_norms, mcp_risk)):
+                self._llm_cache[key] = enhanced_analysis
+                enhanced_analysis = dict(enhanced_analysis)
+            
             return enhanced_analysis
             
         except Exception as e:
             print(f"Enhanced AI Analysis Error: {str(e)}")
             return self._get_fallback_analysis(filename, str(e))
     
-    async def _classify_document_type(self, content: str) -> str:
-        """Classify document type using AI"""
-        classification_prompt = f"""
-        Analyze this legal document and classify its type. Return only one of these types:
-        - contract
-        - privacy_policy
-        - terms_of_service
-        - employment_agreement
-        - intellectual_property
-        - compliance_document
-        - nda
-        - other
-
-        Document content (first 1000 chars):
-        {content[:1000]}
-
-        Return only the document type, nothing else.
-        """
+    async def analyze_batch(self, documents: List[Tuple[str, str, Optional[Callable[[str], None]], Optional[str]]]) -> List[Dict[str, Any]]:
+        """Analyze (content, filename, on_progress, content_hash) documents concurrently; identical documents share one analysis"""
+        
+        pending: Dict[str, Any] = {}
+        keys = []
+        for content, filename, on_progress, content_hash in documents:
+            content_hash = content_hash or _content_hash(content)
+            key = _cache_key("analysis", filename, content_hash)
+            if key not in pending:
+                pending[key] = self.analyze_document(content, filename, on_progress, content_hash)
+            keys.append(key)
+        
+        results = dict(zip(pending, await asyncio.gather(*pending.values())))
+        return [dict(results[key]) for key in keys]
+    
+    async def _gather_mcp_context(self, content: str, doc_type: str) -> List[Dict[str, Any]]:
+        """Run the independent MCP lookups concurrently; failed lookups degrade to error results"""
+        lookups = (
+            self.mcp_server.get_compliance_requirements(doc_type),
+            self.mcp_server.validate_document_structure(content, doc_type),
+            self._search_legal_norms(doc_type)
+        )
         
         try:
-            response = self.model.generate_content(classification_prompt)
-            doc_type = response.text.strip().lower()
-            
-            # Validate classification
-            valid_types = [
-                'contract', 'privacy_policy', 'terms_of_service', 
-                'employment_agreement', 'intellectual_property', 
-                'compliance_document', 'nda', 'other'
-            ]
-            
-            return doc_type if doc_type in valid_types else 'other'
-            
-        except Exception as e:
-            print(f"Document classification error: {e}")
-            return 'other'
+            results = await asyncio.wait_for(
+                asyncio.gather(*lookups, return_exceptions=True),
+                timeout=MCP_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            print(f"MCP lookups timed out after {MCP_TIMEOUT_SECONDS}s")
+            results = [asyncio.TimeoutError("MCP lookup timed out")] * len(lookups)
+        
+        return [
+            {"success": False, "error": str(result) or type(result).__name__}
+            if isinstance(result, BaseException) else result
+            for result in results
+        ]
+    
+    async def _search_legal_norms(self, query: str) -> Dict[str, Any]:
+        """Search legal norms through the MCP server, caching successful results by normalized query"""
+        normalized = query.lower().strip()
+        cached = self._norms_cache.get(normalized)
+        if cached is not None:
+            return cached
+        
+        result = await self.mcp_server.search_legal_norms(normalized)
+        if result.get('success'):
+            self._norms_cache[normalized] = result
+        return result
+    
+    def _guess_document_types(self, content: str) -> List[str]:
+        """Rank likely document types by keyword hits in the opening of the document"""
+        opening = content[:1000]
+        scores = {
+            doc_type: len(pattern.findall(opening))
+            for doc_type, pattern in _DOC_TYPE_PATTERNS.items()
+        }
+        ranked = [doc_type for doc_type, score in sorted(scores.items(), key=lambda item: -item[1]) if score]
+        return ranked[:SPECULATIVE_DOC_TYPES] or ['other']
     
     async def _perform_ai_analysis(self, content: str, filename: str, doc_type: str, 
                                  compliance_req: Dict, structure_validation: Dict, 
                                  legal_norms: Dict) -> Dict[str, Any]:
         """Perform enhanced AI analysis with MCP context"""
         
-        prompt = f"""
-        You are an expert legal document analyzer with access to compliance databases and legal norms.
-        Analyze the following legal document comprehensively.
-
-        Document Information:
-        - Filename: {filename}
-        - Document Type: {doc_type}
-        
-        MCP Server Insights:
-        - Compliance Requirements: {json.dumps(compliance_req.get('requirements', {}), indent=2)}
-        - Structure Completeness: {structure_validation.get('completeness_score', 0)}%
-        - Missing Sections: {structure_validation.get('missing_sections', [])}
-        - Relevant Legal Norms: {json.dumps(legal_norms.get('results', [])[:2], indent=2)}
-        
-        Document Content:
-        {content}
-
-        Provide comprehensive analysis in this JSON format:
-        {{
-            "summary": "Detailed summary incorporating MCP insights",
-            "document_type": "{doc_type}",
-            "key_clauses": ["List of important clauses found"],
-            "risks": [
-                {{
-                    "type": "Risk category",
-                    "level": "Low/Medium/High/Critical",
-                    "description": "Risk description",
-                    "recommendation": "Mitigation strategy",
-                    "regulatory_basis": "Which regulation or norm this relates to"
-                }}
-            ],
-            "obligations": [
-                {{
-                    "party": "Which party",
-                    "description": "Obligation description",
-                    "deadline": "Deadline if any",
-                    "compliance_reference": "Related compliance requirement"
-                }}
-            ],
-            "overall_risk_score": 50,
-            "overall_risk_level": "Medium",
-            "compliance_issues": ["Issues based on MCP compliance requirements"],
-            "recommendations": ["Enhanced recommendations using MCP insights"],
-            "confidence_score": 0.85,
-            "structure_analysis": {{
-                "completeness_score": {structure_validation.get('completeness_score', 0)},
-                "missing_sections": {json.dumps(structure_validation.get('missing_sections', []))},
-                "structural_recommendations": {json.dumps(structure_validation.get('recommendations', []))}
-            }},
-            "regulatory_compliance": {{
-                "applicable_laws": {json.dumps(compliance_req.get('requirements', {}).get('applicable_laws', []))},
-                "compliance_gaps": ["Identified gaps"],
-                "required_clauses_status": "Analysis of required clauses presence"
-            }}
-        }}
-
-        Focus on:
-        1. Integration of MCP server compliance requirements
-        2. Structural completeness based on document type
-        3. Regulatory alignment with identified legal norms
-        4. Enhanced risk assessment using both AI and MCP insights
-        5. Actionable recommendations based on comprehensive analysis
-
-        Respond with valid JSON only.
-        """
+        # Each dynamic value is looked up and serialized once, then reused wherever the prompt needs it
+        requirements = compliance_req.get('requirements', {})
+        requirements_json = _dumps(
+            {field: requirements[field] for field in _PROMPT_REQUIREMENT_KEYS if field in requirements},
+            indent=True
+        )
+        laws_json = _dumps(requirements.get('applicable_laws', []))
+        norms_json = _norms_for_prompt(legal_norms)
+        missing_json = _dumps(structure_validation.get('missing_sections', []))
+        completeness = str(structure_validation.get('completeness_score', 0))
+        recommendations_json = _dumps(structure_validation.get('recommendations', []))
         
-        try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Extract JSON from response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                analysis_result = json.loads(json_str)
-            else:
-                analysis_result = json.loads(response_text)
-            
-            return self._validate_enhanced_analysis(analysis_result)
-            
-        except Exception as e:
-            print(f"AI analysis error: {e}")
-            return self._get_basic_ai_analysis(doc_type, filename)
+        prompt = "".join((
+            _ANALYSIS_PROMPT_HEAD, filename,
+            "\n- Likely Document Type: ", doc_type,
+            "\n\nMCP Server Insights:\n- Compliance Requirements: ", requirements_json,
+            "\n- Structure Completeness: ", completeness,
+            "%\n- Missing Sections: ", missing_json,
+            "\n- Relevant Legal Norms: ", norms_json,
+            "\n\nDocument Content:\n", _truncate_for_prompt(content, PROMPT_MAX_CONTENT_CHARS),
+            _ANALYSIS_PROMPT_SCHEMA, completeness,
+            ',\n        "missing_sections": ', missing_json,
+            ',\n        "structural_recommendations": ', recommendations_json,
+            '\n    },\n    "regulatory_compliance": {\n        "applicable_laws": ', laws_json,
+            _ANALYSIS_PROMPT_TAIL
+        ))
+        
+        analysis_result = await self._generate_json_streamed(prompt)
+        
+        return self._validate_enhanced_analysis(analysis_result)
     
     def _combine_analysis_results(self, ai_analysis: Dict, compliance_req: Dict, 
                                 structure_validation: Dict, legal_norms: Dict, 
                                 mcp_risk: Dict, doc_type: str) -> Dict[str, Any]:
-        """Combine AI analysis with MCP server results"""
+        """Combine AI analysis with MCP server results; ai_analysis is updated in place and returned"""
         
-        enhanced_analysis = dict(ai_analysis)
+        risk_analysis = mcp_risk.get('risk_analysis') or {}
         
         # Add MCP server data
-        enhanced_analysis.update({
-            "analyzed_at": datetime.utcnow().isoformat(),
-            "analysis_version": "enhanced_v1.0",
-            "mcp_integration": {
-                "compliance_requirements": compliance_req,
-                "structure_validation": structure_validation,
-                "legal_norms_search": legal_norms,
-                "mcp_risk_analysis": mcp_risk.get('risk_analysis', {}),
-                "mcp_enabled": True
-            },
-            "enhanced_risk_score": mcp_risk.get('risk_analysis', {}).get('risk_score', 50),
-            "enhanced_risk_level": mcp_risk.get('risk_analysis', {}).get('risk_level', 'Medium'),
-            "compliance_score": mcp_risk.get('risk_analysis', {}).get('compliance_score', 50)
-        })
-        
-        # Enhance recommendations with MCP insights
-        mcp_recommendations = []
-        if structure_validation.get('missing_sections'):
-            for section in structure_validation.get('missing_sections', []):
-                mcp_recommendations.append(f"Add missing section: {section}")
-        
-        if mcp_risk.get('risk_analysis', {}).get('recommendations'):
-            mcp_recommendations.extend(mcp_risk['risk_analysis']['recommendations'])
-        
-        enhanced_analysis['recommendations'] = list(set(
-            enhanced_analysis.get('recommendations', []) + mcp_recommendations
-        ))
+        ai_analysis["analyzed_at"] = datetime.now(timezone.utc).isoformat()
+        ai_analysis["analysis_version"] = "enhanced_v1.0"
+        ai_analysis["mcp_integration"] = {
+            "compliance_requirements": compliance_req,
+            "structure_validation": structure_validation,
+            "legal_norms_search": legal_norms,
+            "mcp_risk_analysis": risk_analysis,
+            "mcp_enabled": True
+        }
+        ai_analysis["enhanced_risk_score"] = risk_analysis.get('risk_score', 50)
+        ai_analysis["enhanced_risk_level"] = risk_analysis.get('risk_level', 'Medium')
+        ai_analysis["compliance_score"] = risk_analysis.get('compliance_score', 50)
+        
+        # Enhance recommendations with MCP insights, deduplicated in first-seen order
+        mcp_recommendations = [
+            f"Add missing section: {section}"
+            for section in structure_validation.get('missing_sections', [])
+        ]
+        mcp_recommendations.extend(risk_analysis.get('recommendations', []))
         
-        return enhanced_analysis
+        ai_analysis['recommendations'] = list(dict.fromkeys(itertools.chain(
+            ai_analysis.get('recommendations', []), mcp_recommendations
+        )))
+        
+        return ai_analysis
     
     async def answer_question(self, document_content: str, question: str, 
-                            filename: str, analysis_context: Dict[str, Any] = None) -> Dict[str, Any]:
-        """Enhanced Q&A with MCP server context"""
+                            filename: str, analysis_context: Dict[str, Any] = None,
+                            content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Enhanced Q&A with MCP server context; content_hash as in analyze_document"""
         
         try:
             # Get document type from analysis context if available
@@ -270,8 +659,13 @@ class EnhancedLegalDocumentAI:
             if analysis_context:
                 doc_type = analysis_context.get('document_type', 'other')
             
+            key = _cache_key("question", filename, str(doc_type), question, content_hash or _content_hash(document_content))
+            cached = self._llm_cache.get(key)
+            if cached is not None:
+                return dict(cached)
+            
             # Get relevant legal norms for the question
-            legal_norms = await self.mcp_server.search_legal_norms(question)
+            legal_norms = await self._search_legal_norms(question)
             
             # Enhanced Q&A prompt with MCP context
             prompt = f"""
@@ -282,13 +676,13 @@ class EnhancedLegalDocumentAI:
             Document Type: {doc_type}
             
             Legal Context from Database:
-            {json.dumps(legal_norms.get('results', []), indent=2)}
+            {_norms_for_prompt(legal_norms)}
             
             Document Analysis Context:
-            {json.dumps(analysis_context or {}, indent=2)[:1000]}...
+            {_dumps(analysis_context or {}, indent=True)[:1000]}...
             
             Document Content:
-            {document_content}
+            {_truncate_for_prompt(document_content, PROMPT_MAX_CONTENT_CHARS)}
 
             User Question: {question}
 
@@ -309,75 +703,115 @@ class EnhancedLegalDocumentAI:
             Respond with valid JSON only.
             """
             
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Extract JSON
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                result = json.loads(json_str)
-            else:
-                result = json.loads(response_text)
+            response = await self._generate(prompt)
+            result = _parse_json_response(response.text)
             
             # Add MCP context to response
             result['mcp_legal_context'] = legal_norms
-            result['answered_at'] = datetime.utcnow().isoformat()
+            result['answered_at'] = datetime.now(timezone.utc).isoformat()
             
-            return result
+            self._llm_cache[key] = result
+            return dict(result)
             
         except Exception as e:
             print(f"Enhanced Q&A Error: {str(e)}")
-            return {
-                "question": question,
-                "answer": "I apologize, but I'm unable to process your question at this time. Please try rephrasing your question or contact support if the issue persists.",
-                "confidence": 0.0,
-                "relevant_sections": [],
-                "recommendations": [],
-                "sources": [],
-                "legal_basis": [],
-                "regulatory_references": [],
-                "risk_considerations": [],
-                "error": str(e)
-            }
+            return self._get_fallback_answer(question, str(e))
     
-    def _validate_enhanced_analysis(self, result: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate enhanced analysis result"""
+    async def answer_questions(self, document_content: str, questions: List[str], 
+                             filename: str, analysis_context: Dict[str, Any] = None,
+                             content_hash: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Answer several questions about one document in a single Gemini request; content_hash as in analyze_document"""
         
-        # Basic validation from original service
-        defaults = {
-            "summary": "Enhanced document analysis completed",
-            "document_type": "Legal Document",
-            "key_clauses": [],
-            "risks": [],
-            "obligations": [],
-            "overall_risk_score": 50,
-            "overall_risk_level": "Medium",
-            "compliance_issues": [],
-            "recommendations": [],
-            "confidence_score": 0.8,
-            "structure_analysis": {
-                "completeness_score": 0,
-                "missing_sections": [],
-                "structural_recommendations": []
-            },
-            "regulatory_compliance": {
-                "applicable_laws": [],
-                "compliance_gaps": [],
-                "required_clauses_status": "Not analyzed"
-            }
-        }
+        doc_type = 'other'
+        if analysis_context:
+            doc_type = analysis_context.get('document_type', 'other')
+        content_hash = content_hash or _content_hash(document_content)
+        
+        # Serve copies of cached answers; only the rest go into the batch prompt
+        keys = [_cache_key("question", filename, str(doc_type), question, content_hash) for question in questions]
+        cached = (self._llm_cache.get(key) for key in keys)
+        results: List[Any] = [dict(result) if result is not None else None for result in cached]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
         
-        for key, default_value in defaults.items():
-            if key not in result:
-                result[key] = default_value
+        try:
+            norms = await asyncio.gather(
+                *(self._search_legal_norms(questions[i]) for i in pending)
+            )
+            numbered_questions = "\n\n".join(
+                f"Question {n}: {questions[i]}\nLegal Context from Database:\n{_norms_for_prompt(legal_norms)}"
+                for n, (i, legal_norms) in enumerate(zip(pending, norms), 1)
+            )
+            
+            prompt = f"""
+            You are an expert legal advisor with access to comprehensive legal databases.
+            Answer each of the user's questions based on the document and available legal context.
+
+            Document: {filename}
+            Document Type: {doc_type}
+            
+            Document Analysis Context:
+            {_dumps(analysis_context or {}, indent=True)[:1000]}...
+            
+            Document Content:
+            {_truncate_for_prompt(document_content, PROMPT_MAX_CONTENT_CHARS)}
+
+            {numbered_questions}
+
+            Provide one answer per question, in the same order, in this JSON format:
+            {{
+                "answers": [
+                    {{
+                        "question": "The question being answered",
+                        "answer": "Comprehensive answer incorporating legal database insights",
+                        "confidence": 0.85,
+                        "relevant_sections": ["Relevant document sections"],
+                        "recommendations": ["Actionable recommendations"],
+                        "sources": ["Document sections supporting the answer"],
+                        "legal_basis": ["Relevant legal norms and regulations"],
+                        "regulatory_references": ["Applicable laws and standards"],
+                        "risk_considerations": ["Any risks related to the question"]
+                    }}
+                ]
+            }}
+
+            Focus on providing accurate, well-sourced answers with regulatory context.
+            Respond with valid JSON only.
+            """
+            
+            response = await self._generate(prompt)
+            answers = _parse_json_response(response.text).get('answers', [])
+            if len(answers) != len(pending):
+                raise ValueError(f"expected {len(pending)} answers, got {len(answers)}")
+            
+            answered_at = datetime.now(timezone.utc).isoformat()
+            for i, legal_norms, result in zip(pending, norms, answers):
+                result['question'] = questions[i]
+                result['mcp_legal_context'] = legal_norms
+                result['answered_at'] = answered_at
+                self._llm_cache[keys[i]] = result
+                results[i] = dict(result)
+            
+        except Exception as e:
+            # Fall back to answering the outstanding questions individually
+            print(f"Enhanced batch Q&A Error: {str(e)}")
+            answers = await asyncio.gather(
+                *(self.answer_question(document_content, questions[i], filename, analysis_context, content_hash) for i in pending)
+            )
+            for i, result in zip(pending, answers):
+                results[i] = result
         
-        # Validate enhanced fields
-        if not isinstance(result.get("structure_analysis"), dict):
-            result["structure_analysis"] = defaults["structure_analysis"]
+        return results
+    
+    def _validate_enhanced_analysis(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate enhanced analysis result"""
         
-        if not isinstance(result.get("regulatory_compliance"), dict):
-            result["regulatory_compliance"] = defaults["regulatory_compliance"]
+        # Fill missing fields in one merge, then merge the nested sections the same way
+        result = {**_ANALYSIS_DEFAULTS, **result}
+        for key in _NESTED_ANALYSIS_KEYS:
+            value = result[key]
+            result[key] = {**_ANALYSIS_DEFAULTS[key], **value} if isinstance(value, dict) else dict(_ANALYSIS_DEFAULTS[key])
         
         return result
     
@@ -386,75 +820,26 @@ class EnhancedLegalDocumentAI:
         
         return {
             "summary": f"Enhanced analysis of {filename} could not be completed. Fallback analysis provided.",
-            "document_type": "Legal Document",
-            "key_clauses": ["Analysis unavailable - manual review required"],
-            "risks": [{
-                "type": "Analysis Risk",
-                "level": "Medium",
-                "description": "Unable to perform comprehensive analysis",
-                "recommendation": "Manual legal review recommended",
-                "regulatory_basis": "General legal practice"
-            }],
-            "obligations": [],
-            "overall_risk_score": 60,
-            "overall_risk_level": "Medium",
-            "compliance_issues": ["Analysis service unavailable"],
-            "recommendations": [
-                "Conduct manual legal review",
-                "Consult with legal counsel",
-                "Retry analysis when service is available"
-            ],
-            "confidence_score": 0.3,
-            "structure_analysis": {
-                "completeness_score": 0,
-                "missing_sections": [],
-                "structural_recommendations": ["Manual structure review needed"]
-            },
-            "regulatory_compliance": {
-                "applicable_laws": [],
-                "compliance_gaps": ["Unable to assess"],
-                "required_clauses_status": "Analysis unavailable"
-            },
-            "analyzed_at": datetime.utcnow().isoformat(),
-            "analysis_version": "enhanced_v1.0_fallback",
-            "error": error,
-            "mcp_integration": {
-                "mcp_enabled": False,
-                "error": "MCP server integration failed"
-            }
+            **copy.deepcopy(_FALLBACK_TEMPLATE),
+            "analyzed_at": datetime.now(timezone.utc).isoformat(),
+            "error": error
         }
     
+    def _get_fallback_answer(self, question: str, error: str) -> Dict[str, Any]:
+        """Answer returned when Q&A fails"""
+        
+        return {"question": question, **_FALLBACK_ANSWER_TEMPLATE, "error": error}
+    
     def _get_basic_ai_analysis(self, doc_type: str, filename: str) -> Dict[str, Any]:
         """Basic AI analysis when full analysis fails"""
         
         return {
             "summary": f"Basic analysis completed for {filename}",
             "document_type": doc_type,
-            "key_clauses": ["Standard legal clauses expected"],
-            "risks": [{
-                "type": "General Risk",
-                "level": "Medium",
-                "description": "Standard legal risks for this document type",
-                "recommendation": "Professional legal review recommended",
-                "regulatory_basis": "General legal standards"
-            }],
-            "obligations": [],
-            "overall_risk_score": 50,
-            "overall_risk_level": "Medium",
-            "compliance_issues": ["Detailed compliance review needed"],
-            "recommendations": ["Seek professional legal advice"],
-            "confidence_score": 0.5,
-            "structure_analysis": {
-                "completeness_score": 50,
-                "missing_sections": ["Unable to determine"],
-                "structural_recommendations": ["Manual structure review recommended"]
-            },
-            "regulatory_compliance": {
-                "applicable_laws": ["Standard legal requirements"],
-                "compliance_gaps": ["Detailed review required"],
-                "required_clauses_status": "Manual verification needed"
-            }
+            **copy.deepcopy(_BASIC_ANALYSIS_TEMPLATE)
         }
 
-# Global enhanced instance
-enhanced_ai_service = EnhancedLegalDocumentAI()
+# Lazily created shared instance; configuring Gemini is deferred to first use
+@functools.lru_cache(maxsize=1)
+def get_enhanced_ai_service() -> EnhancedLegalDocumentAI:
+    return EnhancedLegalDocumentAI()
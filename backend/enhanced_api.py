@@ -5,25 +5,41 @@ Enhanced API for Legal Document Analyzer with Real AI Integration
 
 from fastapi import FastAPI, HTTPException, File, UploadFile, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from datetime import datetime, timedelta
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
+from datetime import datetime
 import os
+import logging
 from dotenv import load_dotenv
 import uuid
+import time
+import copy
+import hashlib
+import codecs
 import asyncio
-import random
 from typing import List, Dict, Any, Optional
-import json
-from io import BytesIO
+import functools
+from collections import OrderedDict
+from itertools import islice
+
+# Optional semantic Q&A cache dependencies
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = None
+    SentenceTransformer = None
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # AI Service imports
 # Import AI service after path setup
 ai_service = None
 
-app = FastAPI(title="Legal Document Analyzer API", version="3.0.0")
+app = FastAPI(title="Legal Document Analyzer API", version="3.0.0", default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -37,30 +53,84 @@ app.add_middleware(
 # Configuration (authentication removed)
 
 # Models
-class DocumentUploadResponse(BaseModel):
+class _APIModel(BaseModel):
+    """Immutable response model that ignores unknown fields"""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+class DocumentUploadResponse(_APIModel):
     document_id: str
     filename: str
     message: str
     workflow_id: str
 
-class WorkflowStatus(BaseModel):
+class WorkflowStatus(_APIModel):
     workflow_id: str
     status: str
     progress: float
     current_step: str
     estimated_completion: Optional[str] = None
 
-class AnalyticsData(BaseModel):
+class AnalyticsData(_APIModel):
     documents_processed: int
     success_rate: float
     average_processing_time: float
     risk_distribution: Dict[str, int]
     document_types: List[Dict[str, Any]]
 
-# In-memory storage (for demo purposes)
-mock_documents = {}
+# In-memory storage (for demo purposes); documents are kept in upload order and
+# the oldest are evicted, with their workflow and results, past MAX_STORED_DOCUMENTS
+MAX_STORED_DOCUMENTS = 10_000
+mock_documents = OrderedDict()
 mock_workflows = {}
+workflow_counts = {"processing": 0, "completed": 0, "failed": 0}  # workflows per status, for the dashboard
 mock_ai_results = {}  # Store AI analysis results
+mock_filenames_lower = {}  # document_id -> lowercased filename, for search
+content_hash_to_doc = {}  # (extension, blake2b of upload bytes) -> document_id whose analysis duplicates reuse
+
+# Q&A answer cache: exact (document_id, normalized question) hits, plus optional
+# embedding-similarity hits within the same document
+QA_CACHE_SIZE = 1024
+QA_SEMANTIC_CACHE_ENABLED = os.getenv("QA_SEMANTIC_CACHE", "0") == "1"
+QA_SEMANTIC_CACHE_MODEL = "all-MiniLM-L6-v2"
+QA_SEMANTIC_CACHE_THRESHOLD = 0.85
+qa_cache = OrderedDict()
+qa_embeddings = {}  # document_id -> [(embedding, cache key)]
+
+# Accepted upload types; the list keeps the order shown in error messages
+ALLOWED_EXTENSIONS = ['.pdf', '.docx', '.txt', '.doc']
+ALLOWED_EXT = frozenset(ALLOWED_EXTENSIONS)
+
+# Uploads are read and decoded in chunks rather than loaded whole
+UPLOAD_CHUNK_SIZE = 1 << 20
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+# Past this many bytes, decoding runs in a worker thread so the event loop stays responsive
+SYNC_EXTRACT_LIMIT = 1_000_000
+
+# Dashboard payload cache; uploads and workflow updates invalidate it
+DASHBOARD_CACHE_TTL = 2.0
+dashboard_cache = {"ts": 0.0, "data": None}
+
+# Workflow stages in order; progress is a stage's position in this list. The
+# analysis stages are reported by the AI service as they start.
+WORKFLOW_STEPS = (
+    "Uploading", 
+    "Extracting Text", 
+    "AI Analysis Starting", 
+    "Analyzing Content", 
+    "Identifying Risks", 
+    "Generating Insights",
+    "Finalizing Report",
+    "Complete"
+)
+WORKFLOW_STEP_INDEX = {step: i for i, step in enumerate(WORKFLOW_STEPS)}
+
+# Documents waiting for analysis are coalesced into batches of up to this many;
+# each batch runs in its own task so batches overlap
+ANALYSIS_BATCH_SIZE = 8
+analysis_queue: Optional[asyncio.Queue] = None
+analysis_consumer_task: Optional[asyncio.Task] = None
+analysis_batch_tasks: set = set()
+
 mock_analytics = {
     "documents_processed": 1247,
     "success_rate": 94.2,
@@ -81,92 +151,178 @@ mock_analytics = {
 }
 
 # Helper functions
-def extract_text_from_file(file_content: bytes, filename: str) -> str:
-    """Extract text content from uploaded file"""
-    try:
+class TextExtractor:
+    """Extract text from an upload incrementally as its chunks arrive"""
+    
+    def __init__(self, filename: str):
         # Simple text extraction - in production, use proper libraries for PDF/DOCX
-        if filename.lower().endswith('.txt'):
-            return file_content.decode('utf-8', errors='ignore')
-        elif filename.lower().endswith('.pdf'):
-            # In production: use PyPDF2 or pdfplumber
-            return file_content.decode('utf-8', errors='ignore')[:2000]  # Sample for demo
-        elif filename.lower().endswith(('.docx', '.doc')):
-            # In production: use python-docx
-            return file_content.decode('utf-8', errors='ignore')[:2000]  # Sample for demo
-        else:
-            return file_content.decode('utf-8', errors='ignore')
-    except Exception as e:
-        print(f"Text extraction error: {str(e)}")
-        return "Error extracting text from document"
-
-async def process_document_with_ai(workflow_id: str, document_id: str, content: str, filename: str):
-    """Process document with real AI analysis"""
-    steps = [
-        "Uploading", 
-        "Extracting Text", 
-        "AI Analysis Starting", 
-        "Analyzing Content", 
-        "Identifying Risks", 
-        "Generating Insights",
-        "Finalizing Report",
-        "Complete"
-    ]
+        # PDF/DOC(X) keep only a sample for demo; other types are decoded in full
+        self.limit = 2000 if filename.lower().endswith(('.pdf', '.docx', '.doc')) else None
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self._parts = []
+        self._length = 0
+    
+    def feed(self, chunk: bytes):
+        """Decode the next chunk, skipping work once a sample limit is reached"""
+        if self.limit is not None and self._length >= self.limit:
+            return
+        text = self._decoder.decode(chunk)
+        self._parts.append(text)
+        self._length += len(text)
+    
+    def finish(self) -> str:
+        """Return the extracted text"""
+        self._parts.append(self._decoder.decode(b"", final=True))
+        text = "".join(self._parts)
+        return text if self.limit is None else text[:self.limit]
+
+def store_workflow(workflow: Dict[str, Any]):
+    """Save a workflow record, keeping workflow_counts in step with its status"""
+    previous = mock_workflows.get(workflow["workflow_id"])
+    if previous is not None:
+        workflow_counts[previous["status"]] -= 1
+    workflow_counts[workflow["status"]] += 1
+    mock_workflows[workflow["workflow_id"]] = workflow
+    invalidate_dashboard_cache()
+
+def invalidate_dashboard_cache():
+    """Force the next dashboard request to rebuild its payload"""
+    dashboard_cache["ts"] = 0.0
+
+def evict_old_documents():
+    """Drop the oldest documents and everything stored for them past MAX_STORED_DOCUMENTS"""
+    while len(mock_documents) > MAX_STORED_DOCUMENTS:
+        document_id, doc = mock_documents.popitem(last=False)
+        workflow = mock_workflows.pop(doc["workflow_id"], None)
+        if workflow is not None:
+            workflow_counts[workflow["status"]] -= 1
+        mock_ai_results.pop(document_id, None)
+        mock_filenames_lower.pop(document_id, None)
+        qa_embeddings.pop(document_id, None)
+        hash_key = (os.path.splitext(doc["filename"])[1].lower(), doc["content_hash"])
+        if content_hash_to_doc.get(hash_key) == document_id:
+            del content_hash_to_doc[hash_key]
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for cache lookups"""
+    return " ".join(question.lower().split())
+
+@functools.lru_cache(maxsize=1)
+def get_question_embedder():
+    """Load the sentence embedding model, or None when the semantic cache is off"""
+    if not QA_SEMANTIC_CACHE_ENABLED or SentenceTransformer is None:
+        return None
+    return SentenceTransformer(QA_SEMANTIC_CACHE_MODEL)
+
+async def embed_question(question: str):
+    """Return a normalized question embedding, or None if the semantic cache is off"""
+    embedder = get_question_embedder()
+    if embedder is None:
+        return None
+    return await asyncio.to_thread(embedder.encode, question, normalize_embeddings=True)
+
+def lookup_cached_answer(document_id: str, key: tuple, embedding) -> Optional[Dict[str, Any]]:
+    """Return a cached answer for the same or a near-duplicate question about a document"""
+    cached = qa_cache.get(key)
+    if cached is not None:
+        qa_cache.move_to_end(key)
+        return cached
+    
+    if embedding is not None:
+        for cached_embedding, cached_key in qa_embeddings.get(document_id, ()):
+            if cached_key in qa_cache and float(np.dot(embedding, cached_embedding)) >= QA_SEMANTIC_CACHE_THRESHOLD:
+                qa_cache.move_to_end(cached_key)
+                return qa_cache[cached_key]
+    return None
+
+def store_cached_answer(document_id: str, key: tuple, result: Dict[str, Any], embedding):
+    """Cache an answer, evicting the least recently used entries past QA_CACHE_SIZE"""
+    qa_cache[key] = result
+    qa_cache.move_to_end(key)
+    evicted = False
+    while len(qa_cache) > QA_CACHE_SIZE:
+        qa_cache.popitem(last=False)
+        evicted = True
+    
+    entries = qa_embeddings.setdefault(document_id, [])
+    if evicted:
+        entries[:] = [entry for entry in entries if entry[1] in qa_cache]
+    if embedding is not None:
+        entries.append((embedding, key))
+
+async def process_document_with_ai(workflow_id: str, document_id: str, content: str, filename: str, content_hash: str):
+    """Process document with real AI analysis, advancing the workflow as each stage actually starts"""
+    created_at = datetime.utcnow()
+    
+    def update_workflow(step: str):
+        # The document may have been evicted while its analysis ran
+        if document_id not in mock_documents:
+            return
+        i = WORKFLOW_STEP_INDEX[step]
+        store_workflow({
+            "workflow_id": workflow_id,
+            "status": "processing" if i < len(WORKFLOW_STEPS) - 1 else "completed",
+            "progress": (i / (len(WORKFLOW_STEPS) - 1)) * 100,
+            "current_step": step,
+            "estimated_completion": "2-3 minutes" if i < len(WORKFLOW_STEPS) - 1 else None,
+            "created_at": created_at,
+            # Epoch seconds; formatted when the status is read
+            "updated_at": time.time()
+        })
     
     try:
-        for i, step in enumerate(steps):
-            progress = (i / (len(steps) - 1)) * 100
-            
-            # Update workflow status
-            mock_workflows[workflow_id] = {
-                "workflow_id": workflow_id,
-                "status": "processing" if i < len(steps) - 1 else "completed",
-                "progress": progress,
-                "current_step": step,
-                "estimated_completion": "2-3 minutes" if i < len(steps) - 1 else None,
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
+        # The upload has already been read and its text extracted
+        update_workflow("Extracting Text")
+        update_workflow("AI Analysis Starting")
+        
+        logger.info("Starting AI analysis for document: %s", filename)
+        if ai_service:
+            try:
+                future = asyncio.get_running_loop().create_future()
+                await analysis_queue.put((content, filename, update_workflow, content_hash, future))
+                ai_result = await future
+                logger.info("AI analysis completed for: %s", filename)
+            except Exception as ai_error:
+                logger.warning("AI analysis failed: %s", ai_error)
+                # Create fallback analysis result
+                ai_result = {
+                    "summary": f"Document {filename} uploaded successfully. AI analysis failed but document is stored.",
+                    "risk_level": "Unknown",
+                    "key_points": ["AI analysis unavailable"],
+                    "analysis_status": "failed"
+                }
+        else:
+            logger.warning("AI service not available, creating mock analysis")
+            ai_result = {
+                "summary": f"Document {filename} uploaded successfully. AI analysis will be available when service is initialized.",
+                "risk_level": "Pending",
+                "key_points": ["Upload successful", "AI analysis pending"],
+                "analysis_status": "pending"
             }
-            
-            # Perform AI analysis during the analysis steps
-            if step == "AI Analysis Starting":
-                print(f"Starting AI analysis for document: {filename}")
-                if ai_service:
-                    try:
-                        ai_result = await ai_service.analyze_document(content, filename)
-                        mock_ai_results[document_id] = ai_result
-                        print(f"AI analysis completed for: {filename}")
-                    except Exception as ai_error:
-                        print(f"AI analysis failed: {ai_error}")
-                        # Create fallback analysis result
-                        mock_ai_results[document_id] = {
-                            "summary": f"Document {filename} uploaded successfully. AI analysis failed but document is stored.",
-                            "risk_level": "Unknown",
-                            "key_points": ["AI analysis unavailable"],
-                            "analysis_status": "failed"
-                        }
-                else:
-                    print("AI service not available, creating mock analysis")
-                    mock_ai_results[document_id] = {
-                        "summary": f"Document {filename} uploaded successfully. AI analysis will be available when service is initialized.",
-                        "risk_level": "Pending",
-                        "key_points": ["Upload successful", "AI analysis pending"],
-                        "analysis_status": "pending"
-                    }
-            
-            await asyncio.sleep(1 if i < 3 else 2)  # Slower for AI steps
+        
+        # Don't recreate results for a document evicted in the meantime
+        if document_id not in mock_documents:
+            logger.info("Document %s was evicted during analysis, discarding its result", document_id)
+            return
+        mock_ai_results[document_id] = ai_result
+        
+        update_workflow("Finalizing Report")
+        update_workflow("Complete")
             
     except Exception as e:
-        print(f"AI Processing Error: {str(e)}")
+        logger.exception("AI Processing Error: %s", e)
+        if document_id not in mock_documents:
+            return
         # Mark workflow as failed but store fallback result
-        mock_workflows[workflow_id] = {
+        store_workflow({
             "workflow_id": workflow_id,
             "status": "failed",
             "progress": 100,
             "current_step": f"Failed: {str(e)}",
             "estimated_completion": None,
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat()
-        }
+            "created_at": created_at,
+            "updated_at": time.time()
+        })
 
 # API Endpoints
 @app.get("/")
@@ -192,7 +348,7 @@ async def health():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "uptime": "99.9%",
         "services": {
             "database": "connected",
@@ -212,42 +368,63 @@ async def upload_document(
     """Upload document for AI-powered analysis"""
     try:
         # Debug logging
-        print(f"File info: {file.filename}, content_type: {file.content_type}")
+        logger.debug("File info: %s, content_type: %s", file.filename, file.content_type)
         
         # Validate file
         if not file.filename:
-            print("Error: No filename provided")
+            logger.info("Upload rejected: no filename provided")
             raise HTTPException(status_code=400, detail="No file provided")
         
-        allowed_extensions = ['.pdf', '.docx', '.txt', '.doc']
-        file_extension = '.' + file.filename.split('.')[-1].lower() if '.' in file.filename else ''
+        file_extension = os.path.splitext(file.filename)[1].lower()
         
-        if file_extension not in allowed_extensions:
-            print(f"Error: Invalid file extension: {file_extension}")
-            raise HTTPException(status_code=400, detail=f"File type not supported. Allowed: {allowed_extensions}")
+        if file_extension not in ALLOWED_EXT:
+            logger.info("Upload rejected: invalid file extension %s", file_extension)
+            raise HTTPException(status_code=400, detail=f"File type not supported. Allowed: {ALLOWED_EXTENSIONS}")
         
-        # Read file content
-        content = await file.read()
-        file_size = len(content)
-        print(f"File size: {file_size} bytes")
-        
-        if file_size > 50 * 1024 * 1024:  # 50MB limit
-            print(f"Error: File too large: {file_size} bytes")
-            raise HTTPException(status_code=413, detail="File too large. Maximum size: 50MB")
+        # Stream file content through the text extractor; raw bytes are never held in full
+        extractor = TextExtractor(file.filename)
+        hasher = hashlib.blake2b(digest_size=16)
+        file_size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            file_size += len(chunk)
+            if file_size > MAX_UPLOAD_SIZE:  # 50MB limit
+                logger.info("Upload rejected: file too large, over %d bytes", file_size)
+                raise HTTPException(status_code=413, detail="File too large. Maximum size: 50MB")
+            hasher.update(chunk)
+            if file_size > SYNC_EXTRACT_LIMIT:
+                await asyncio.to_thread(extractor.feed, chunk)
+            else:
+                extractor.feed(chunk)
+        logger.debug("File size: %d bytes", file_size)
         
         if file_size == 0:
-            print("Error: Empty file")
+            logger.info("Upload rejected: empty file")
             raise HTTPException(status_code=400, detail="Empty file not allowed")
         
         # Extract text content
-        text_content = extract_text_from_file(content, file.filename)
-        print(f"Extracted text length: {len(text_content)} characters")
+        if file_size > SYNC_EXTRACT_LIMIT:
+            text_content = await asyncio.to_thread(extractor.finish)
+        else:
+            text_content = extractor.finish()
+        content_hash = hasher.hexdigest()
+        
+        # Identical uploads share the first copy's extracted text and reuse its completed
+        # analysis; look them up before eviction can drop that copy
+        hash_key = (file_extension, content_hash)
+        existing_id = content_hash_to_doc.get(hash_key)
+        existing_doc = mock_documents.get(existing_id)
+        if existing_doc is not None:
+            text_content = existing_doc["content"]
+        previous_result = mock_ai_results.get(existing_id)
+        reuse_analysis = previous_result is not None and previous_result.get("analysis_status") not in ("failed", "pending")
+        text_length = len(text_content)
+        logger.debug("Extracted text length: %d characters", text_length)
         
         # Generate IDs
         document_id = str(uuid.uuid4())
         workflow_id = str(uuid.uuid4())
         
-        print(f"Generated document_id: {document_id}, workflow_id: {workflow_id}")
+        logger.debug("Generated document_id: %s, workflow_id: %s", document_id, workflow_id)
         
         # Store document metadata
         mock_documents[document_id] = {
@@ -256,15 +433,37 @@ async def upload_document(
             "file_size": file_size,
             "content_type": file.content_type,
             "content": text_content,  # Store extracted content
-            "upload_timestamp": datetime.utcnow().isoformat(),
+            "text_length": text_length,
+            "content_hash": content_hash,
+            "upload_timestamp": datetime.utcnow(),
             "status": "uploaded",
             "workflow_id": workflow_id,
         }
+        mock_filenames_lower[document_id] = file.filename.lower()
+        
+        if reuse_analysis:
+            logger.info("Duplicate upload of %s, reusing its analysis", existing_id)
+            # A copy, so the two documents' results can't change each other
+            mock_ai_results[document_id] = copy.deepcopy(previous_result)
+            store_workflow({
+                "workflow_id": workflow_id,
+                "status": "completed",
+                "progress": 100,
+                "current_step": "Complete",
+                "estimated_completion": None,
+                "created_at": datetime.utcnow(),
+                "updated_at": time.time()
+            })
+        else:
+            # Later duplicates reuse this upload once its analysis finishes
+            content_hash_to_doc[hash_key] = document_id
+            # Start AI-powered background processing
+            background_tasks.add_task(process_document_with_ai, workflow_id, document_id, text_content, file.filename, content_hash)
         
-        # Start AI-powered background processing
-        background_tasks.add_task(process_document_with_ai, workflow_id, document_id, text_content, file.filename)
+        evict_old_documents()
+        invalidate_dashboard_cache()
         
-        print(f"Upload successful: {file.filename} -> {document_id}")
+        logger.info("Upload successful: %s -> %s", file.filename, document_id)
         
         return DocumentUploadResponse(
             document_id=document_id,
@@ -276,9 +475,7 @@ async def upload_document(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Unexpected error during upload: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error during upload: %s", e)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 @app.get("/documents/{document_id}")
@@ -294,11 +491,8 @@ async def get_document_details(
     # Get AI analysis results
     ai_results = mock_ai_results.get(document_id, {})
     
-    # Combine document info with AI results
-    doc_with_analysis = dict(doc)
-    doc_with_analysis.update(ai_results)
-    
-    return doc_with_analysis
+    # Combine document info with AI results; orjson serializes the merged dict directly
+    return ORJSONResponse({**doc, **ai_results})
 
 @app.post("/documents/{document_id}/question")
 async def ask_question(
@@ -321,13 +515,23 @@ async def ask_question(
     try:
         # Use enhanced AI service to answer the question with analysis context
         if ai_service:
-            result = await ai_service.answer_question(
-                document_content, 
-                question, 
-                filename, 
-                analysis_context  # Pass analysis context for enhanced answers
-            )
-            result["timestamp"] = datetime.utcnow().isoformat()
+            key = (document_id, normalize_question(question))
+            embedding = None if key in qa_cache else await embed_question(key[1])
+            cached = lookup_cached_answer(document_id, key, embedding)
+            if cached is not None:
+                result = dict(cached, question=question)
+            else:
+                result = await ai_service.answer_question(
+                    document_content, 
+                    question, 
+                    filename, 
+                    analysis_context,  # Pass analysis context for enhanced answers
+                    doc["content_hash"]
+                )
+                # Skip caching if the document was evicted while the answer was generated
+                if "error" not in result and document_id in mock_documents:
+                    store_cached_answer(document_id, key, dict(result), embedding)
+            result["timestamp"] = datetime.utcnow()
             result["enhanced_ai_version"] = "v1.0_with_mcp"
             result["mcp_integration_enabled"] = True
             return result
@@ -340,13 +544,13 @@ async def ask_question(
                 "relevant_sections": [],
                 "recommendations": ["Upload successful", "AI analysis pending"],
                 "sources": [],
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.utcnow(),
                 "enhanced_ai_version": "v1.0_fallback",
                 "mcp_integration_enabled": False
             }
         
     except Exception as e:
-        print(f"Enhanced Q&A Error: {str(e)}")
+        logger.exception("Enhanced Q&A Error: %s", e)
         return {
             "question": question,
             "answer": "I apologize, but I'm unable to process your question at this time. Please try again later.",
@@ -357,7 +561,7 @@ async def ask_question(
             "legal_basis": [],
             "regulatory_references": [],
             "risk_considerations": [],
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": datetime.utcnow(),
             "error": str(e),
             "enhanced_ai_version": "v1.0_with_mcp_fallback",
             "mcp_integration_enabled": False
@@ -370,15 +574,15 @@ async def get_documents(
     search: Optional[str] = None
 ):
     """Get all documents with pagination and search"""
-    # Get all documents
-    user_docs = list(mock_documents.values())
-    
-    # Apply search filter
+    # Apply search filter against the prebuilt lowercase filename index
     if search:
+        query = search.lower()
         user_docs = [
-            doc for doc in user_docs 
-            if search.lower() in doc["filename"].lower()
+            mock_documents[doc_id] for doc_id, filename in mock_filenames_lower.items()
+            if query in filename
         ]
+    else:
+        user_docs = list(mock_documents.values())
     
     # Apply pagination
     total = len(user_docs)
@@ -392,7 +596,7 @@ async def get_documents(
         "has_more": offset + limit < total
     }
 
-@app.get("/workflows/{workflow_id}/status")
+@app.get("/workflows/{workflow_id}/status", response_model=None)
 async def get_workflow_status(
     workflow_id: str
 ):
@@ -407,24 +611,34 @@ async def get_workflow_status(
             "estimated_completion": "3-5 minutes"
         }
     
-    return mock_workflows[workflow_id]
+    workflow = mock_workflows[workflow_id]
+    return ORJSONResponse({**workflow, "updated_at": datetime.utcfromtimestamp(workflow["updated_at"])})
 
-@app.get("/analytics/dashboard")
+@app.get("/analytics/dashboard", response_model=None)
 async def get_dashboard_analytics():
     """Get dashboard analytics data"""
-    # Generate some dynamic data
+    now = time.monotonic()
+    if dashboard_cache["data"] is not None and now - dashboard_cache["ts"] < DASHBOARD_CACHE_TTL:
+        return ORJSONResponse(dashboard_cache["data"])
+    
+    # Last five uploads, oldest first, without copying every document
+    recent_documents = list(islice(reversed(mock_documents.values()), 5))
+    recent_documents.reverse()
+    
+    # Generate some dynamic data; random is only needed here, so it is not imported at startup
+    import random
     base_stats = {
         "total_documents": len(mock_documents),
-        "active_workflows": len([w for w in mock_workflows.values() if w["status"] == "processing"]),
-        "completed_analyses": len([w for w in mock_workflows.values() if w["status"] == "completed"]),
+        "active_workflows": workflow_counts["processing"],
+        "completed_analyses": workflow_counts["completed"],
         "average_risk_score": round(random.uniform(0.3, 0.8), 2),
         "success_rate": 94.2,
-        "recent_documents": list(mock_documents.values())[-5:] if mock_documents else [],
+        "recent_documents": recent_documents,
         "system_health": {
             "api_status": "operational",
             "ai_engine": "connected",
-            "processing_queue": len([w for w in mock_workflows.values() if w["status"] == "processing"]),
-            "last_backup": datetime.utcnow().isoformat()
+            "processing_queue": workflow_counts["processing"],
+            "last_backup": datetime.utcnow()
         },
         "monthly_trends": [
             {"month": "Jan", "documents": 45, "risks": 18},
@@ -442,24 +656,80 @@ async def get_dashboard_analytics():
         ]
     }
     
-    return base_stats
+    dashboard_cache["data"] = base_stats
+    dashboard_cache["ts"] = now
+    return ORJSONResponse(base_stats)
 
 @app.get("/analytics/detailed")
 async def get_detailed_analytics():
     """Get detailed analytics for Analytics page"""
     return mock_analytics
 
+async def analyze_queued_batch(items: list):
+    """Analyze one batch of queued documents and resolve each waiting future"""
+    try:
+        results = await ai_service.analyze_batch([item[:4] for item in items])
+    except Exception as e:
+        for *_, future in items:
+            if not future.done():
+                future.set_exception(e)
+    else:
+        for (*_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+    finally:
+        # Cancelled batches (e.g. on shutdown) must not leave uploads waiting forever
+        for *_, future in items:
+            if not future.done():
+                future.cancel()
+
+async def analysis_consumer():
+    """Take up to ANALYSIS_BATCH_SIZE waiting documents at a time and analyze each batch in its own task"""
+    while True:
+        items = [await analysis_queue.get()]
+        while not analysis_queue.empty() and len(items) < ANALYSIS_BATCH_SIZE:
+            items.append(analysis_queue.get_nowait())
+        
+        # Don't await the batch here, so later uploads never wait behind a slow analysis
+        task = asyncio.create_task(analyze_queued_batch(items))
+        analysis_batch_tasks.add(task)
+        task.add_done_callback(analysis_batch_tasks.discard)
+
+@app.on_event("startup")
+async def start_analysis_consumer():
+    global analysis_queue, analysis_consumer_task
+    analysis_queue = asyncio.Queue()
+    analysis_consumer_task = asyncio.create_task(analysis_consumer())
+
+@app.on_event("shutdown")
+async def stop_analysis_consumer():
+    tasks = [task for task in (analysis_consumer_task, *analysis_batch_tasks) if task]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
 # Initialize AI service on startup
-try:
-    from enhanced_ai_service import enhanced_ai_service
-    ai_service = enhanced_ai_service
-    print("[OK] Enhanced AI service initialized successfully")
-except Exception as e:
-    print(f"[WARNING] AI service initialization failed: {e}")
-    print("API will run with limited functionality")
-    ai_service = None
+@app.on_event("startup")
+async def init_ai_service():
+    """Create the enhanced AI service once the app starts rather than at import time"""
+    global ai_service
+    try:
+        from enhanced_ai_service import get_enhanced_ai_service
+        ai_service = get_enhanced_ai_service()
+        logger.info("Enhanced AI service initialized successfully")
+    except Exception as e:
+        logger.warning("AI service initialization failed: %s", e)
+        logger.warning("API will run with limited functionality")
+        ai_service = None
+
+@app.on_event("shutdown")
+async def close_ai_service():
+    """Release the AI service's pooled Gemini connection"""
+    if ai_service:
+        await ai_service.close()
 
 if __name__ == "__main__":
     import uvicorn
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
     print("Starting Enhanced Legal Document Analyzer API with AI Integration...")
     uvicorn.run(app, host="0.0.0.0", port=8000)
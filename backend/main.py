@@ -5,6 +5,10 @@ Main entry point for the Legal Document Analyzer Backend API
 
 import os
 import sys
+import atexit
+import logging
+import logging.handlers
+import queue
 import uvicorn
 from dotenv import load_dotenv
 
@@ -15,6 +19,14 @@ sys.path.insert(0, current_dir)
 # Load environment variables from the backend directory
 load_dotenv(os.path.join(current_dir, '.env'))
 
+# Setup logging; records are formatted by the QueueHandler and written to stderr
+# by a listener thread so request handlers never block on console I/O
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), handlers=[logging.handlers.QueueHandler(log_queue)])
+log_listener.start()
+atexit.register(log_listener.stop)
+
 # Import the API app
 from enhanced_api import app
 
@@ -6,10 +6,134 @@ Model Context Protocol integration for external tool access
 
 import asyncio
 import json
+import re
+import copy
+from bisect import bisect_left
+from types import MappingProxyType
 from typing import Any, Dict, List, Optional
 from datetime import datetime
 import logging
 
+# Optional multi-pattern matcher for section detection; falls back to a compiled regex
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Maximum number of distinct queries memoized by LegalNormsDatabase.search_norms
+SEARCH_CACHE_SIZE = 256
+
+# Compliance requirements by document type; static and read-only, so shared rather than
+# rebuilt per call (get_compliance_requirements hands out copies)
+_COMPLIANCE_REQUIREMENTS = MappingProxyType({
+    "contract": MappingProxyType({
+        "applicable_laws": ("common_law", "ucc", "consumer_protection"),
+        "key_clauses_required": (
+            "Consideration clause",
+            "Termination provisions", 
+            "Dispute resolution",
+            "Governing law"
+        ),
+        "risk_factors": ("enforceability", "ambiguity", "compliance")
+    }),
+    "privacy_policy": MappingProxyType({
+        "applicable_laws": ("gdpr", "ccpa", "coppa"),
+        "key_clauses_required": (
+            "Data collection disclosure",
+            "Purpose of processing",
+            "User rights",
+            "Cookie policy",
+            "Third-party sharing"
+        ),
+        "risk_factors": ("privacy_violations", "regulatory_fines", "user_trust")
+    }),
+    "terms_of_service": MappingProxyType({
+        "applicable_laws": ("consumer_protection", "advertising_law"),
+        "key_clauses_required": (
+            "Service description",
+            "User obligations",
+            "Limitation of liability",
+            "Intellectual property rights"
+        ),
+        "risk_factors": ("user_disputes", "service_abuse", "legal_challenges")
+    })
+})
+
+_DEFAULT_COMPLIANCE_REQUIREMENTS = MappingProxyType({
+    "applicable_laws": ("general_contract_law",),
+    "key_clauses_required": ("Basic legal requirements",),
+    "risk_factors": ("legal_compliance",)
+})
+
+# Sections expected per document type for structure validation, and the phrase searched for each
+_REQUIRED_SECTIONS = MappingProxyType({
+    "contract": ("parties", "consideration", "terms", "signatures"),
+    "privacy_policy": ("data_collection", "usage", "sharing", "rights"),
+    "terms_of_service": ("service_description", "user_obligations", "limitations")
+})
+_DEFAULT_REQUIRED_SECTIONS = ("basic_structure",)
+_SECTION_PHRASES = {
+    section: section.replace("_", " ")
+    for sections in (*_REQUIRED_SECTIONS.values(), _DEFAULT_REQUIRED_SECTIONS)
+    for section in sections
+}
+
+def _build_section_matcher(sections):
+    """Return a function finding which sections' phrases occur in lowercased content, in one scan"""
+    wanted = len(sections)
+    
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for section in sections:
+            automaton.add_word(_SECTION_PHRASES[section], section)
+        automaton.make_automaton()
+        
+        def find(content_lower: str) -> set:
+            found = set()
+            for _, section in automaton.iter(content_lower):
+                found.add(section)
+                if len(found) == wanted:
+                    break
+            return found
+        return find
+    
+    # Zero-width lookahead alternation: reports every position where some phrase starts,
+    # naming only the first alternative that matches there
+    phrases = [_SECTION_PHRASES[section] for section in sections]
+    pattern = re.compile("(?=(" + "|".join(re.escape(phrase) for phrase in phrases) + "))")
+    phrase_index = {phrase: i for i, phrase in enumerate(phrases)}
+    
+    def find(content_lower: str) -> set:
+        found = set()
+        for match in pattern.finditer(content_lower):
+            # Earlier phrases already failed here; later ones may start at the same position
+            for i in range(phrase_index[match.group(1)], wanted):
+                if content_lower.startswith(phrases[i], match.start()):
+                    found.add(sections[i])
+            if len(found) == wanted:
+                break
+        return found
+    return find
+
+# Risk scoring weights; a score maps to the first level whose upper bound it does not exceed
+RISK_BASE_SCORE = 30
+RISK_FACTOR_WEIGHT = 10
+COMPLIANCE_ISSUE_WEIGHT = 15
+_RISK_LEVEL_BOUNDS = (25, 50, 75)
+_RISK_LEVELS = ("Low", "Medium", "High", "Critical")
+
+def _score_risk(num_risks: int, num_issues: int):
+    """Return the capped risk score and its level for the given finding counts"""
+    risk_score = min(RISK_BASE_SCORE + num_risks * RISK_FACTOR_WEIGHT + num_issues * COMPLIANCE_ISSUE_WEIGHT, 100)
+    return risk_score, _RISK_LEVELS[bisect_left(_RISK_LEVEL_BOUNDS, risk_score)]
+
+# Generic mitigation advice attached to every risk calculation
+_DEFAULT_RISK_RECOMMENDATIONS = (
+    "Review identified risk areas",
+    "Implement risk mitigation strategies",
+    "Regular compliance monitoring"
+)
+
 class LegalNormsDatabase:
     """Mock legal norms database for MCP server"""
     
@@ -62,63 +186,42 @@ class LegalNormsDatabase:
             }
         }
     
+        # Lowercased search fields and ready-made results, built once over the static corpus
+        self._index = [
+            (
+                norm_data["name"].lower(),
+                norm_data["description"].lower(),
+                tuple(req.lower() for req in norm_data["key_requirements"]),
+                {**norm_data, "norm_id": norm_id}
+            )
+            for norm_id, norm_data in self.norms.items()
+        ]
+        self._search_cache: Dict[str, List[Dict[str, Any]]] = {}
+    
     def search_norms(self, query: str) -> List[Dict[str, Any]]:
         """Search legal norms database"""
-        results = []
         query_lower = query.lower()
         
-        for norm_id, norm_data in self.norms.items():
-            if (query_lower in norm_data["name"].lower() or 
-                query_lower in norm_data["description"].lower() or
-                any(query_lower in req.lower() for req in norm_data["key_requirements"])):
-                
-                result = dict(norm_data)
-                result["norm_id"] = norm_id
-                results.append(result)
+        results = self._search_cache.get(query_lower)
+        if results is None:
+            results = [
+                result for name, description, requirements, result in self._index
+                if (query_lower in name or 
+                    query_lower in description or
+                    any(query_lower in req for req in requirements))
+            ]
+            
+            # Bounded memo; the oldest query is dropped first
+            if len(self._search_cache) >= SEARCH_CACHE_SIZE:
+                del self._search_cache[next(iter(self._search_cache))]
+            self._search_cache[query_lower] = results
         
-        return results
+        return [copy.deepcopy(result) for result in results]
     
     def get_compliance_requirements(self, document_type: str, jurisdiction: str = "US") -> Dict[str, Any]:
         """Get compliance requirements for document type"""
-        requirements = {
-            "contract": {
-                "applicable_laws": ["common_law", "ucc", "consumer_protection"],
-                "key_clauses_required": [
-                    "Consideration clause",
-                    "Termination provisions", 
-                    "Dispute resolution",
-                    "Governing law"
-                ],
-                "risk_factors": ["enforceability", "ambiguity", "compliance"]
-            },
-            "privacy_policy": {
-                "applicable_laws": ["gdpr", "ccpa", "coppa"],
-                "key_clauses_required": [
-                    "Data collection disclosure",
-                    "Purpose of processing",
-                    "User rights",
-                    "Cookie policy",
-                    "Third-party sharing"
-                ],
-                "risk_factors": ["privacy_violations", "regulatory_fines", "user_trust"]
-            },
-            "terms_of_service": {
-                "applicable_laws": ["consumer_protection", "advertising_law"],
-                "key_clauses_required": [
-                    "Service description",
-                    "User obligations",
-                    "Limitation of liability",
-                    "Intellectual property rights"
-                ],
-                "risk_factors": ["user_disputes", "service_abuse", "legal_challenges"]
-            }
-        }
-        
-        return requirements.get(document_type.lower(), {
-            "applicable_laws": ["general_contract_law"],
-            "key_clauses_required": ["Basic legal requirements"],
-            "risk_factors": ["legal_compliance"]
-        })
+        requirements = _COMPLIANCE_REQUIREMENTS.get(document_type.lower(), _DEFAULT_COMPLIANCE_REQUIREMENTS)
+        return {key: list(values) for key, values in requirements.items()}
 
 class RiskCalculator:
     """Mock risk calculation service for MCP server"""
@@ -127,34 +230,17 @@ class RiskCalculator:
     def calculate_document_risk(document_analysis: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate risk score based on document analysis"""
         
-        # Mock risk calculation logic
-        base_risk = 30
+        # Mock risk calculation logic; risk increases with identified issues
         risk_factors = document_analysis.get("risks", [])
         compliance_issues = document_analysis.get("compliance_issues", [])
-        
-        # Increase risk based on identified issues
-        risk_score = base_risk + (len(risk_factors) * 10) + (len(compliance_issues) * 15)
-        risk_score = min(risk_score, 100)  # Cap at 100
-        
-        if risk_score <= 25:
-            risk_level = "Low"
-        elif risk_score <= 50:
-            risk_level = "Medium"  
-        elif risk_score <= 75:
-            risk_level = "High"
-        else:
-            risk_level = "Critical"
+        risk_score, risk_level = _score_risk(len(risk_factors), len(compliance_issues))
         
         return {
             "risk_score": risk_score,
             "risk_level": risk_level,
             "risk_factors": risk_factors,
             "compliance_score": max(100 - risk_score, 0),
-            "recommendations": [
-                "Review identified risk areas",
-                "Implement risk mitigation strategies",
-                "Regular compliance monitoring"
-            ],
+            "recommendations": list(_DEFAULT_RISK_RECOMMENDATIONS),
             "calculated_at": datetime.utcnow().isoformat()
         }
 
@@ -164,6 +250,10 @@ class MCPServer:
     def __init__(self):
         self.norms_db = LegalNormsDatabase()
         self.risk_calculator = RiskCalculator()
+        self._section_matchers = {
+            sections: _build_section_matcher(sections)
+            for sections in (*_REQUIRED_SECTIONS.values(), _DEFAULT_REQUIRED_SECTIONS)
+        }
         self.tools = {
             "search_legal_norms": self.search_legal_norms,
             "get_compliance_requirements": self.get_compliance_requirements,
@@ -222,20 +312,14 @@ class MCPServer:
         """Validate document structure"""
         try:
             # Mock document structure validation
-            required_sections = {
-                "contract": ["parties", "consideration", "terms", "signatures"],
-                "privacy_policy": ["data_collection", "usage", "sharing", "rights"],
-                "terms_of_service": ["service_description", "user_obligations", "limitations"]
-            }
-            
-            sections_required = required_sections.get(document_type.lower(), ["basic_structure"])
+            sections_required = _REQUIRED_SECTIONS.get(document_type.lower(), _DEFAULT_REQUIRED_SECTIONS)
             sections_found = []
             missing_sections = []
             
-            # Simple keyword-based section detection
-            content_lower = document_content.lower()
+            # Keyword-based section detection in a single pass over the content
+            present = self._section_matchers[sections_required](document_content.lower())
             for section in sections_required:
-                if section.replace("_", " ") in content_lower:
+                if section in present:
                     sections_found.append(section)
                 else:
                     missing_sections.append(section)
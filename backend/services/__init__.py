@@ -7,13 +7,37 @@ This package contains the core AI services for document analysis:
 - WorkflowOrchestrator: Manages the complete document analysis workflow
 """
 
-from .document_processor import DocumentProcessor, ProcessedDocument
-from .document_analyzer import (
-    DocumentAnalyzer, DocumentEntity, ClauseAnalysis, RiskAssessment,
-    ExtractedEntities, ObligationsRights, NormsBenchmarking, 
-    Recommendations, AnalysisResult, UserProfile
-)
-from .workflow_orchestrator import DocumentAnalysisWorkflow, WorkflowResult, WorkflowStatus
+import importlib
+from typing import TYPE_CHECKING
+
+# Submodules pull in heavy dependencies (Gemini SDK, document parsers), so exported
+# names are imported on first access (PEP 562) rather than when the package loads
+_LAZY = {
+    "DocumentProcessor": "document_processor",
+    "ProcessedDocument": "document_processor",
+    "DocumentAnalyzer": "document_analyzer",
+    "DocumentEntity": "document_analyzer",
+    "ClauseAnalysis": "document_analyzer",
+    "RiskAssessment": "document_analyzer",
+    "ExtractedEntities": "document_analyzer",
+    "ObligationsRights": "document_analyzer",
+    "NormsBenchmarking": "document_analyzer",
+    "Recommendations": "document_analyzer",
+    "AnalysisResult": "document_analyzer",
+    "UserProfile": "document_analyzer",
+    "DocumentAnalysisWorkflow": "workflow_orchestrator",
+    "WorkflowResult": "workflow_orchestrator",
+    "WorkflowStatus": "workflow_orchestrator"
+}
+
+if TYPE_CHECKING:
+    from .document_processor import DocumentProcessor, ProcessedDocument
+    from .document_analyzer import (
+        DocumentAnalyzer, DocumentEntity, ClauseAnalysis, RiskAssessment,
+        ExtractedEntities, ObligationsRights, NormsBenchmarking, 
+        Recommendations, AnalysisResult, UserProfile
+    )
+    from .workflow_orchestrator import DocumentAnalysisWorkflow, WorkflowResult, WorkflowStatus
 
 __all__ = [
     "DocumentProcessor",
@@ -32,3 +56,13 @@ __all__ = [
     "WorkflowResult",
     "WorkflowStatus"
 ]
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module("." + _LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return __all__
@@ -1,13 +1,177 @@
 import re
+import os
 import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import google.generativeai as genai
+from google.generativeai import caching
+from cachetools import TTLCache
 from dataclasses import dataclass
 import logging
 
+# Optional semantic cache dependencies
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = None
+    SentenceTransformer = None
+
+# Optional multi-pattern engines for the pattern-based fallbacks (Aho-Corasick for
+# literal phrases; Hyperscan, then RE2 for regexes)
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+try:
+    import re2
+except ImportError:
+    re2 = None
+
 logger = logging.getLogger(__name__)
 
+# Gemini response cache; bump LLM_CACHE_NAMESPACE whenever a prompt template changes.
+# Exact hits are keyed by the SHA-256 of the prompt and can be persisted to SQLite
+# (ANALYZER_CACHE_DB). The optional semantic tier covers clause classification only;
+# risk assessments and document-level answers turn on the exact parties, amounts and
+# terms, so they are never shared between near-identical text (e.g. one template).
+LLM_CACHE_NAMESPACE = "gemini-pro-v1"
+LLM_CACHE_SIZE = 2048
+LLM_CACHE_TTL_SECONDS = 24 * 3600
+LLM_CACHE_DB = os.getenv("ANALYZER_CACHE_DB")
+SEMANTIC_CACHE_ENABLED = os.getenv("ANALYZER_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_MODEL = "all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# Opt-in Gemini context caching for long documents: DocumentAnalyzer.document_context
+# (entered by analyze_document and the workflow orchestrator) uploads the full document
+# once and stage prompts reference the cache instead of embedding an excerpt. The model
+# must support caching (e.g. models/gemini-1.5-flash-001), and Gemini rejects caches
+# under ~32k tokens, so shorter documents keep using excerpts.
+CONTEXT_CACHE_MODEL = os.getenv("ANALYZER_CONTEXT_CACHE_MODEL")
+CONTEXT_CACHE_MIN_CHARS = 32768 * 4
+CONTEXT_CACHE_TTL = timedelta(minutes=10)
+_CACHED_DOCUMENT_NOTE = "[The full document is provided in the cached context]"
+
+# Regex-based entity extraction (linear-time RE2 when installed) and section splitting, compiled once
+_compile_entity_pattern = re2.compile if re2 is not None else re.compile
+_DATE_PATTERNS = [_compile_entity_pattern('(?i)' + pattern) for pattern in (
+    r'\b\d{1,2}/\d{1,2}/\d{4}\b',
+    r'\b\d{4}-\d{2}-\d{2}\b',
+    r'\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}\b'
+)]
+_MONEY_PATTERNS = [_compile_entity_pattern('(?i)' + pattern) for pattern in (
+    r'\$[\d,]+\.?\d*',
+    r'\b\d+\.\d{2}\s*dollars?\b',
+    r'\b\d+\s*USD\b'
+)]
+# Common legal section indicators, tried in order until one matches
+_SECTION_PATTERNS = [re.compile(pattern, re.MULTILINE | re.IGNORECASE) for pattern in (
+    r'\n\s*\d+\.\s*',  # Numbered sections
+    r'\n\s*\([a-z]\)\s*',  # Lettered subsections
+    r'\n\s*[A-Z][A-Z\s]+\n',  # ALL CAPS headings
+    r'\n\s*SECTION\s+\d+',  # Section headers
+    r'\n\s*Article\s+\d+',  # Article headers
+)]
+
+# Pattern risk tiers in reporting order: tier -> (concern, score weight)
+_RISK_TIERS = {
+    'critical': ('Critical risk detected', 0.4),
+    'high': ('High risk pattern found', 0.3),
+    'medium': ('Moderate risk indicator', 0.1)
+}
+
+def _build_pattern_matcher(patterns: List[str]):
+    """Return a function giving the indices of the case-insensitive patterns found in a text, in one scan"""
+    if hyperscan is not None:
+        database = hyperscan.Database()
+        flags = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+        database.compile(
+            expressions=[pattern.encode() for pattern in patterns],
+            ids=list(range(len(patterns))),
+            elements=len(patterns),
+            flags=[flags] * len(patterns)
+        )
+        
+        def find(text: str) -> set:
+            found = set()
+            database.scan(text.encode(), match_event_handler=lambda id, start, end, flags, context: found.add(id))
+            return found
+        return find
+    
+    if re2 is not None:
+        pattern_set = re2.Set.SearchSet()
+        for pattern in patterns:
+            pattern_set.Add('(?i)' + pattern)
+        pattern_set.Compile()
+        
+        def find(text: str) -> set:
+            return set(pattern_set.Match(text))
+        return find
+    
+    # Zero-width lookahead alternation: reports every position where some pattern matches,
+    # naming only the first alternative that matches there
+    regex = re.compile("(?=" + "|".join(f"(?P<p{i}>{pattern})" for i, pattern in enumerate(patterns)) + ")", re.IGNORECASE)
+    compiled = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+    
+    def find(text: str) -> set:
+        found = set()
+        for match in regex.finditer(text):
+            # Earlier alternatives already failed here; later ones may match at the same position
+            first = int(match.lastgroup[1:])
+            found.add(first)
+            for i in range(first + 1, len(compiled)):
+                if i not in found and compiled[i].match(text, match.start()):
+                    found.add(i)
+            if len(found) == len(compiled):
+                break
+        return found
+    return find
+
+def _build_phrase_matcher(phrases: List[str]):
+    """Return a function giving the indices of the literal phrases found (case-insensitively) in a text"""
+    if ahocorasick is None:
+        return _build_pattern_matcher([re.escape(phrase) for phrase in phrases])
+    
+    automaton = ahocorasick.Automaton()
+    for i, phrase in enumerate(phrases):
+        automaton.add_word(phrase.lower(), i)
+    automaton.make_automaton()
+    wanted = len(phrases)
+    
+    def find(text: str) -> set:
+        found = set()
+        for _, i in automaton.iter(text.lower()):
+            found.add(i)
+            if len(found) == wanted:
+                break
+        return found
+    return find
+
+# (document text, model bound to its context cache) for the analysis in progress
+_document_context: ContextVar[Optional[Tuple[str, Any]]] = ContextVar("document_context", default=None)
+
+def _excerpt(text: str, limit: int) -> str:
+    """Return a document excerpt for a prompt, or a reference to the cached document"""
+    context = _document_context.get()
+    if context is not None and context[0] is text:
+        return _CACHED_DOCUMENT_NOTE
+    return text[:limit] + "..."
+
+# Maximum clauses analyzed at once; each clause makes two Gemini calls
+CLAUSE_CONCURRENCY = 8
+
 @dataclass
 class DocumentEntity:
     """Represents an extracted entity from the document"""
@@ -114,17 +278,28 @@ class DocumentAnalyzer:
     def __init__(self, api_key: str):
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel('gemini-pro')
+        self._clause_semaphore = asyncio.Semaphore(CLAUSE_CONCURRENCY)
+        
+        # Exact and semantic Gemini response caches
+        self._llm_cache: TTLCache = TTLCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL_SECONDS)
+        self._cache_db = self._open_cache_db(LLM_CACHE_DB) if LLM_CACHE_DB else None
+        self._cache_db_lock = threading.Lock()
+        self._embedder = None
+        self._semantic_index: Dict[str, Tuple[Any, List[str]]] = {}  # kind -> (embeddings, responses)
         
-        # Legal clause patterns and risk indicators
+        # Legal clause patterns (compiled case-insensitive) and risk indicators
         self.clause_patterns = {
-            'termination': [r'terminat\w+', r'end this agreement', r'dissolve'],
-            'liability': [r'liabilit\w+', r'responsible for', r'damages'],
-            'indemnity': [r'indemnif\w+', r'hold harmless', r'defend'],
-            'payment': [r'payment', r'fee\w*', r'cost\w*', r'amount'],
-            'confidentiality': [r'confidential\w*', r'non-disclosure', r'proprietary'],
-            'renewal': [r'renew\w*', r'extend\w*', r'automatic'],
-            'governing_law': [r'governing law', r'jurisdiction', r'courts'],
-            'dispute_resolution': [r'dispute\w*', r'arbitration', r'mediation']
+            clause_type: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for clause_type, patterns in {
+                'termination': [r'terminat\w+', r'end this agreement', r'dissolve'],
+                'liability': [r'liabilit\w+', r'responsible for', r'damages'],
+                'indemnity': [r'indemnif\w+', r'hold harmless', r'defend'],
+                'payment': [r'payment', r'fee\w*', r'cost\w*', r'amount'],
+                'confidentiality': [r'confidential\w*', r'non-disclosure', r'proprietary'],
+                'renewal': [r'renew\w*', r'extend\w*', r'automatic'],
+                'governing_law': [r'governing law', r'jurisdiction', r'courts'],
+                'dispute_resolution': [r'dispute\w*', r'arbitration', r'mediation']
+            }.items()
         }
         
         # Risk indicators
@@ -143,6 +318,159 @@ class DocumentAnalyzer:
                 'unlimited damages', 'criminal liability'
             ]
         }
+        
+        # Single-pass matchers over every clause pattern and risk phrase
+        self._clause_pattern_types = [
+            clause_type for clause_type, patterns in self.clause_patterns.items() for _ in patterns
+        ]
+        self._clause_matcher = _build_pattern_matcher(
+            [pattern.pattern for patterns in self.clause_patterns.values() for pattern in patterns]
+        )
+        self._risk_phrases = [
+            (tier, phrase) for tier in _RISK_TIERS for phrase in self.risk_indicators[tier]
+        ]
+        self._risk_matcher = _build_phrase_matcher([phrase for _, phrase in self._risk_phrases])
+
+    async def _llm(self, prompt: str, kind: str = "", embed_text: Optional[str] = None) -> str:
+        """Return Gemini's text for a prompt, from the exact or semantic cache when possible
+        
+        kind scopes semantic matches to one call site and the prompt inputs that are not
+        embedded; prompts without embed_text are only cached exactly. Pass embed_text only
+        for clause classification, whose answer names the kind of clause rather than its
+        specific terms. Prompts that refer to a context-cached document are sent to the
+        model bound to that cache.
+        """
+        model = self.model
+        key_source = f"{LLM_CACHE_NAMESPACE}\0{prompt}"
+        context = _document_context.get()
+        if context is not None and _CACHED_DOCUMENT_NOTE in prompt:
+            model = context[1]
+            key_source += "\0" + hashlib.sha256(context[0].encode()).hexdigest()
+        
+        key = hashlib.sha256(key_source.encode()).hexdigest()
+        cached = self._llm_cache.get(key)
+        if cached is None and self._cache_db is not None:
+            cached = await asyncio.to_thread(self._db_get, key)
+            if cached is not None:
+                self._llm_cache[key] = cached
+        if cached is not None:
+            return cached
+        
+        embedding = None
+        if embed_text is not None:
+            embedding = await self._embed(embed_text)
+            cached = self._semantic_lookup(kind, embedding)
+            if cached is not None:
+                return cached
+        
+        response = await model.generate_content_async(prompt)
+        text = response.text
+        
+        self._llm_cache[key] = text
+        if embedding is not None:
+            self._semantic_store(kind, embedding, text)
+        if self._cache_db is not None:
+            await asyncio.to_thread(self._db_put, key, text)
+        return text
+
+    async def _create_document_context(self, text: str) -> Optional[Tuple[Any, Any]]:
+        """Upload a long document to a Gemini context cache, returning (cache, model) or None"""
+        if not CONTEXT_CACHE_MODEL or len(text) < CONTEXT_CACHE_MIN_CHARS:
+            return None
+        
+        try:
+            cache = await asyncio.to_thread(
+                caching.CachedContent.create,
+                model=CONTEXT_CACHE_MODEL, contents=[text], ttl=CONTEXT_CACHE_TTL
+            )
+            return cache, genai.GenerativeModel.from_cached_content(cache)
+        except Exception as e:
+            logger.warning("Context cache creation failed, sending document excerpts: %s", e)
+            return None
+
+    @asynccontextmanager
+    async def document_context(self, text: str):
+        """Share a long document's context cache with every stage prompt run inside this block
+        
+        Tasks started inside the block inherit the context, so callers must finish them
+        before leaving it; the cache is deleted on exit.
+        """
+        document_context = await self._create_document_context(text)
+        token = _document_context.set((text, document_context[1]) if document_context else None)
+        try:
+            yield
+        finally:
+            _document_context.reset(token)
+            if document_context:
+                try:
+                    await asyncio.to_thread(document_context[0].delete)
+                except Exception as e:
+                    logger.warning("Context cache cleanup failed: %s", e)
+
+    @staticmethod
+    def _open_cache_db(path: str) -> Optional[sqlite3.Connection]:
+        """Open the persistent response cache, or None if it cannot be used"""
+        try:
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT, created REAL)")
+            return db
+        except sqlite3.Error as e:
+            logger.warning("Analyzer cache database unavailable: %s", e)
+            return None
+
+    def _db_get(self, key: str) -> Optional[str]:
+        """Read an unexpired response from the persistent cache"""
+        with self._cache_db_lock:
+            row = self._cache_db.execute(
+                "SELECT response FROM llm_cache WHERE key = ? AND created > ?",
+                (key, time.time() - LLM_CACHE_TTL_SECONDS)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _db_put(self, key: str, text: str):
+        """Write a response to the persistent cache"""
+        try:
+            with self._cache_db_lock, self._cache_db:
+                self._cache_db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, created) VALUES (?, ?, ?)",
+                    (key, text, time.time())
+                )
+        except sqlite3.Error as e:
+            logger.warning("Analyzer cache persist failed: %s", e)
+
+    async def _embed(self, text: str) -> Optional[Any]:
+        """Return a normalized embedding of text, or None if the semantic cache is off"""
+        if not SEMANTIC_CACHE_ENABLED or SentenceTransformer is None:
+            return None
+        
+        if self._embedder is None:
+            self._embedder = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+        
+        return await asyncio.to_thread(self._embedder.encode, text[:4096], normalize_embeddings=True)
+
+    def _semantic_lookup(self, kind: str, embedding: Any) -> Optional[str]:
+        """Return a cached response for a near-duplicate input of the same kind, if any"""
+        if embedding is None or kind not in self._semantic_index:
+            return None
+        
+        embeddings, responses = self._semantic_index[kind]
+        scores = np.dot(embeddings, embedding)
+        best = int(np.argmax(scores))
+        if scores[best] >= SEMANTIC_CACHE_THRESHOLD:
+            return responses[best]
+        
+        return None
+
+    def _semantic_store(self, kind: str, embedding: Any, text: str):
+        """Add a response to the semantic index, keeping the newest LLM_CACHE_SIZE per kind"""
+        row = embedding.reshape(1, -1)
+        if kind in self._semantic_index:
+            embeddings, responses = self._semantic_index[kind]
+            embeddings = np.vstack([embeddings, row])[-LLM_CACHE_SIZE:]
+            responses = (responses + [text])[-LLM_CACHE_SIZE:]
+        else:
+            embeddings, responses = row, [text]
+        self._semantic_index[kind] = (embeddings, responses)
 
     async def analyze_document(self, text: str, document_type: str = "contract", 
                              user_profile: str = "individual") -> Dict[str, Any]:
@@ -150,29 +478,39 @@ class DocumentAnalyzer:
         Comprehensive document analysis including summarization, entity extraction,
         risk assessment, and clause analysis
         """
-        try:
-            # 1. Document Summarization
-            summary = await self._generate_summary(text, user_profile)
-            
-            # 2. Entity Extraction
-            entities = await self._extract_entities(text)
-            
+        async def clause_risk_chain():
             # 3. Clause Segmentation and Classification
             clauses = await self._segment_and_classify_clauses(text)
             
             # 4. Risk Assessment
             risk_assessment = await self._assess_risks(text, clauses, user_profile)
             
-            # 5. Key Obligations and Rights
-            obligations = await self._extract_obligations_rights(text)
-            
-            # 6. Norm Benchmarking
-            benchmarking = await self._benchmark_against_norms(text, document_type)
-            
             # 7. Generate Recommendations
             recommendations = await self._generate_recommendations(
                 text, risk_assessment, clauses, user_profile
             )
+            return clauses, risk_assessment, recommendations
+        
+        try:
+            async with self.document_context(text):
+                # Only risks and recommendations depend on earlier stages, so the other
+                # stages (1. summary, 2. entities, 5. obligations and rights, 6. norm
+                # benchmarking) run concurrently with the clause -> risk -> recommendation chain
+                stages = [asyncio.ensure_future(stage) for stage in (
+                    self._generate_summary(text, user_profile),
+                    self._extract_entities(text),
+                    self._extract_obligations_rights(text),
+                    self._benchmark_against_norms(text, document_type),
+                    clause_risk_chain()
+                )]
+                try:
+                    summary, entities, obligations, benchmarking, (clauses, risk_assessment, recommendations) = await asyncio.gather(*stages)
+                except BaseException:
+                    # Stop the remaining stages before their cached context is deleted
+                    for stage in stages:
+                        stage.cancel()
+                    await asyncio.gather(*stages, return_exceptions=True)
+                    raise
             
             return {
                 'analysis_id': self._generate_analysis_id(),
@@ -200,7 +538,7 @@ class DocumentAnalyzer:
             Analyze this legal document and provide a clear, executive-level summary.
             User Profile: {user_profile}
             
-            Document Text: {text[:4000]}...
+            Document Text: {_excerpt(text, 4000)}
             
             Please provide:
             1. One-sentence overview
@@ -217,7 +555,7 @@ class DocumentAnalyzer:
             Provide a detailed analysis of this legal document in simple terms.
             User Profile: {user_profile}
             
-            Document: {text[:4000]}...
+            Document: {_excerpt(text, 4000)}
             
             Explain:
             1. What this document is and its purpose
@@ -236,7 +574,7 @@ class DocumentAnalyzer:
             Focus on potential risks and concerns in this document.
             User Profile: {user_profile}
             
-            Document: {text[:4000]}...
+            Document: {_excerpt(text, 4000)}
             
             Identify:
             1. Major risks and potential problems
@@ -250,14 +588,19 @@ class DocumentAnalyzer:
             """
         }
         
+        # The summaries are independent, so request them concurrently
+        responses = await asyncio.gather(
+            *[self._llm(prompt) for prompt in prompts.values()],
+            return_exceptions=True
+        )
+        
         summaries = {}
-        for summary_type, prompt in prompts.items():
-            try:
-                response = await self.model.generate_content_async(prompt)
-                summaries[summary_type] = response.text
-            except Exception as e:
-                logger.error(f"Summary generation failed for {summary_type}: {str(e)}")
+        for summary_type, response in zip(prompts, responses):
+            if isinstance(response, Exception):
+                logger.error(f"Summary generation failed for {summary_type}: {str(response)}")
                 summaries[summary_type] = "Summary generation failed"
+            else:
+                summaries[summary_type] = response
         
         return summaries
 
@@ -266,7 +609,7 @@ class DocumentAnalyzer:
         prompt = f"""
         Extract key information from this legal document:
         
-        {text[:4000]}...
+        {_excerpt(text, 4000)}
         
         Find and extract:
         1. Party names and roles (who is involved)
@@ -281,9 +624,8 @@ class DocumentAnalyzer:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
             # Parse the response and structure it
-            entities_text = response.text
+            entities_text = await self._llm(prompt)
             
             # Also use regex patterns for backup extraction
             regex_entities = self._extract_entities_regex(text)
@@ -301,14 +643,8 @@ class DocumentAnalyzer:
         entities = []
         
         # Date patterns
-        date_patterns = [
-            r'\b\d{1,2}/\d{1,2}/\d{4}\b',
-            r'\b\d{4}-\d{2}-\d{2}\b',
-            r'\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}\b'
-        ]
-        
-        for pattern in date_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
+        for pattern in _DATE_PATTERNS:
+            matches = pattern.finditer(text)
             for match in matches:
                 entities.append({
                     'type': 'date',
@@ -318,14 +654,8 @@ class DocumentAnalyzer:
                 })
         
         # Money patterns
-        money_patterns = [
-            r'\$[\d,]+\.?\d*',
-            r'\b\d+\.\d{2}\s*dollars?\b',
-            r'\b\d+\s*USD\b'
-        ]
-        
-        for pattern in money_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
+        for pattern in _MONEY_PATTERNS:
+            matches = pattern.finditer(text)
             for match in matches:
                 entities.append({
                     'type': 'monetary_amount',
@@ -341,14 +671,18 @@ class DocumentAnalyzer:
         # First, segment the text into logical sections
         sections = self._segment_text(text)
         
+        async def analyze_section(section):
+            # Classify the clause type and assess its risk level using AI
+            async with self._clause_semaphore:
+                return await asyncio.gather(
+                    self._classify_clause(section),
+                    self._analyze_clause_risk(section)
+                )
+        
+        results = await asyncio.gather(*[analyze_section(section) for section in sections])
+        
         clauses = []
-        for i, section in enumerate(sections):
-            # Classify the clause type using AI
-            classification = await self._classify_clause(section)
-            
-            # Assess risk level for this clause
-            risk_analysis = await self._analyze_clause_risk(section)
-            
+        for i, (section, (classification, risk_analysis)) in enumerate(zip(sections, results)):
             clause = {
                 'id': f"clause_{i+1}",
                 'text': section[:500] + "..." if len(section) > 500 else section,
@@ -364,19 +698,11 @@ class DocumentAnalyzer:
     def _segment_text(self, text: str) -> List[str]:
         """Segment document text into logical sections/clauses"""
         # Split by common legal section indicators
-        patterns = [
-            r'\n\s*\d+\.\s*',  # Numbered sections
-            r'\n\s*\([a-z]\)\s*',  # Lettered subsections
-            r'\n\s*[A-Z][A-Z\s]+\n',  # ALL CAPS headings
-            r'\n\s*SECTION\s+\d+',  # Section headers
-            r'\n\s*Article\s+\d+',  # Article headers
-        ]
-        
         sections = []
         remaining_text = text
         
-        for pattern in patterns:
-            matches = list(re.finditer(pattern, remaining_text, re.MULTILINE | re.IGNORECASE))
+        for pattern in _SECTION_PATTERNS:
+            matches = list(pattern.finditer(remaining_text))
             if matches:
                 # Split based on this pattern
                 current_pos = 0
@@ -419,9 +745,8 @@ class DocumentAnalyzer:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
             return {
-                'ai_classification': response.text,
+                'ai_classification': await self._llm(prompt, "clause_classification", clause_text),
                 'pattern_classification': self._classify_clause_patterns(clause_text)
             }
         except Exception as e:
@@ -432,13 +757,13 @@ class DocumentAnalyzer:
 
     def _classify_clause_patterns(self, clause_text: str) -> Dict[str, Any]:
         """Pattern-based clause classification as backup"""
-        clause_lower = clause_text.lower()
+        found = self._clause_matcher(clause_text)
         matches = {}
         
-        for clause_type, patterns in self.clause_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, clause_lower):
-                    matches[clause_type] = matches.get(clause_type, 0) + 1
+        # Count matching patterns per clause type, in pattern order so ties resolve as before
+        for i, clause_type in enumerate(self._clause_pattern_types):
+            if i in found:
+                matches[clause_type] = matches.get(clause_type, 0) + 1
         
         if matches:
             primary_type = max(matches.items(), key=lambda x: x[1])
@@ -469,8 +794,7 @@ class DocumentAnalyzer:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
-            ai_risk = response.text
+            ai_risk = await self._llm(prompt)
         except:
             ai_risk = "Risk analysis failed"
         
@@ -485,37 +809,20 @@ class DocumentAnalyzer:
 
     def _detect_risk_patterns(self, text: str) -> Dict[str, Any]:
         """Pattern-based risk detection"""
-        text_lower = text.lower()
+        found = self._risk_matcher(text)
         detected_risks = []
         risk_score = 0
         
-        # Check for high-risk patterns
-        for risk_phrase in self.risk_indicators['critical']:
-            if risk_phrase.lower() in text_lower:
-                detected_risks.append({
-                    'type': 'critical',
-                    'phrase': risk_phrase,
-                    'concern': 'Critical risk detected'
-                })
-                risk_score += 0.4
-        
-        for risk_phrase in self.risk_indicators['high']:
-            if risk_phrase.lower() in text_lower:
-                detected_risks.append({
-                    'type': 'high',
-                    'phrase': risk_phrase,
-                    'concern': 'High risk pattern found'
-                })
-                risk_score += 0.3
-        
-        for risk_phrase in self.risk_indicators['medium']:
-            if risk_phrase.lower() in text_lower:
+        # Report phrases by tier, most severe first
+        for i, (tier, risk_phrase) in enumerate(self._risk_phrases):
+            if i in found:
+                concern, weight = _RISK_TIERS[tier]
                 detected_risks.append({
-                    'type': 'medium',
+                    'type': tier,
                     'phrase': risk_phrase,
-                    'concern': 'Moderate risk indicator'
+                    'concern': concern
                 })
-                risk_score += 0.1
+                risk_score += weight
         
         # Determine overall risk level
         if risk_score >= 0.4:
@@ -561,7 +868,7 @@ class DocumentAnalyzer:
         Perform a comprehensive risk assessment of this legal document.
         User Profile: {user_profile}
         
-        Document: {text[:3000]}...
+        Document: {_excerpt(text, 3000)}
         
         Provide:
         1. Overall risk level (Low/Medium/High/Critical)
@@ -576,8 +883,7 @@ class DocumentAnalyzer:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
-            ai_assessment = response.text
+            ai_assessment = await self._llm(prompt)
         except:
             ai_assessment = "Risk assessment failed"
         
@@ -598,7 +904,9 @@ class DocumentAnalyzer:
         
         return RiskAssessment(
             overall_risk=overall_risk,
+            overall_risk_level=overall_risk,
             risk_score=avg_risk_score * 100,
+            identified_risks=[],  # Will be parsed from AI response
             critical_issues=[],  # Will be parsed from AI response
             warnings=[],  # Will be parsed from AI response
             recommendations=[]  # Will be parsed from AI response
@@ -609,7 +917,7 @@ class DocumentAnalyzer:
         prompt = f"""
         Extract the key obligations and rights from this legal document:
         
-        Document: {text[:3000]}...
+        Document: {_excerpt(text, 3000)}
         
         For each party identified, list:
         1. Their main obligations (what they must do)
@@ -621,8 +929,7 @@ class DocumentAnalyzer:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
-            return {'ai_extracted': response.text}
+            return {'ai_extracted': await self._llm(prompt)}
         except:
             return {'ai_extracted': "Extraction failed"}
 
@@ -631,7 +938,7 @@ class DocumentAnalyzer:
         prompt = f"""
         Compare this {document_type} against standard industry norms and practices:
         
-        Document: {text[:2000]}...
+        Document: {_excerpt(text, 2000)}
         
         Analyze:
         1. How does this compare to typical {document_type} terms?
@@ -645,9 +952,8 @@ class DocumentAnalyzer:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
             return {
-                'analysis': response.text,
+                'analysis': await self._llm(prompt),
                 'document_type': document_type,
                 'benchmark_date': datetime.utcnow().isoformat()
             }
@@ -664,7 +970,7 @@ class DocumentAnalyzer:
         prompt = f"""
         Based on this legal document analysis, provide actionable recommendations:
         
-        Document excerpt: {text[:2000]}...
+        Document excerpt: {_excerpt(text, 2000)}
         User Profile: {user_profile}
         Overall Risk Level: {risk_assessment.overall_risk}
         
@@ -680,8 +986,7 @@ class DocumentAnalyzer:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
-            return {'recommendations': response.text}
+            return {'recommendations': await self._llm(prompt)}
         except:
             return {'recommendations': "Recommendation generation failed"}
 
@@ -708,8 +1013,7 @@ class DocumentAnalyzer:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
-            return response.text
+            return await self._llm(prompt)
         except Exception as e:
             return f"I'm sorry, I couldn't answer your question due to a technical issue: {str(e)}"
 
@@ -892,7 +1196,6 @@ class DocumentAnalyzer:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
-            return response.text
+            return await self._llm(prompt)
         except Exception as e:
             return f"I'm sorry, I couldn't answer your question due to a technical issue: {str(e)}"
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from contextlib import AsyncExitStack
 from typing import Dict, List, Any, Optional, Callable
 from dataclasses import dataclass, asdict
 from enum import Enum
@@ -69,9 +70,15 @@ class DocumentAnalysisWorkflow:
     Orchestrates the complete document analysis workflow
     """
     
-    def __init__(self, gemini_api_key: str):
-        self.document_processor = DocumentProcessor()
-        self.document_analyzer = DocumentAnalyzer(gemini_api_key)
+    def __init__(
+        self,
+        gemini_api_key: str,
+        document_analyzer: Optional[DocumentAnalyzer] = None,
+        document_processor: Optional[DocumentProcessor] = None
+    ):
+        # Callers may pass shared instances so every workflow reuses one Gemini client
+        self.document_processor = document_processor or DocumentProcessor()
+        self.document_analyzer = document_analyzer or DocumentAnalyzer(gemini_api_key)
         self.active_workflows: Dict[str, WorkflowResult] = {}
         self.step_registry: Dict[str, Callable] = {}
         self._register_default_steps()
@@ -282,51 +289,59 @@ class DocumentAnalysisWorkflow:
         steps_by_id = {step.id: step for step in workflow_result.steps}
         completed_steps = set()
         
-        while len(completed_steps) < len(workflow_result.steps):
-            # Find steps ready to execute
-            ready_steps = []
-            for step in workflow_result.steps:
-                if (step.status == StepStatus.PENDING and 
-                    all(dep_id in completed_steps for dep_id in step.dependencies)):
-                    ready_steps.append(step)
-            
-            if not ready_steps:
-                failed_steps = [s for s in workflow_result.steps if s.status == StepStatus.FAILED]
-                if failed_steps:
-                    raise Exception(f"Workflow blocked by failed steps: {[s.id for s in failed_steps]}")
-                else:
-                    raise Exception("Workflow deadlock detected")
-            
-            # Execute ready steps (can be parallelized)
-            tasks = []
-            for step in ready_steps:
-                task = self._execute_step(step, context)
-                tasks.append(task)
-            
-            # Wait for all ready steps to complete
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Process results
-            for step, result in zip(ready_steps, results):
-                if isinstance(result, Exception):
-                    step.status = StepStatus.FAILED
-                    step.error_message = str(result)
-                    step.end_time = datetime.utcnow()
-                    
-                    # Check if this is a critical step
-                    if step.id in ['document_processing', 'ai_analysis']:
-                        raise result
+        async with AsyncExitStack() as document_context:
+            while len(completed_steps) < len(workflow_result.steps):
+                # Find steps ready to execute
+                ready_steps = []
+                for step in workflow_result.steps:
+                    if (step.status == StepStatus.PENDING and 
+                        all(dep_id in completed_steps for dep_id in step.dependencies)):
+                        ready_steps.append(step)
+                
+                if not ready_steps:
+                    failed_steps = [s for s in workflow_result.steps if s.status == StepStatus.FAILED]
+                    if failed_steps:
+                        raise Exception(f"Workflow blocked by failed steps: {[s.id for s in failed_steps]}")
+                    else:
+                        raise Exception("Workflow deadlock detected")
+                
+                # Execute ready steps (can be parallelized)
+                tasks = []
+                for step in ready_steps:
+                    task = self._execute_step(step, context)
+                    tasks.append(task)
+                
+                # Wait for all ready steps to complete
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+                
+                # Process results
+                for step, result in zip(ready_steps, results):
+                    if isinstance(result, Exception):
+                        step.status = StepStatus.FAILED
+                        step.error_message = str(result)
+                        step.end_time = datetime.utcnow()
+                        
+                        # Check if this is a critical step
+                        if step.id in ['document_processing', 'ai_analysis']:
+                            raise result
+                        else:
+                            logger.warning(f"Non-critical step {step.id} failed: {str(result)}")
                     else:
-                        logger.warning(f"Non-critical step {step.id} failed: {str(result)}")
-                else:
-                    step.status = StepStatus.COMPLETED
-                    step.result = result
-                    step.end_time = datetime.utcnow()
-                    step.progress = 100.0
-                    completed_steps.add(step.id)
-                    
-                    # Update context with step results
-                    context[f"{step.id}_result"] = result
+                        step.status = StepStatus.COMPLETED
+                        step.result = result
+                        step.end_time = datetime.utcnow()
+                        step.progress = 100.0
+                        completed_steps.add(step.id)
+                        
+                        # Update context with step results
+                        context[f"{step.id}_result"] = result
+                        
+                        # Later stages share one context cache of the text chosen for analysis
+                        if step.id == 'ai_analysis':
+                            processed_doc = workflow_result.processed_document
+                            await document_context.enter_async_context(
+                                self.document_analyzer.document_context(processed_doc.redacted_content or processed_doc.content)
+                            )
 
     async def _execute_step(self, step: WorkflowStep, context: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a single workflow step"""
@@ -353,8 +368,10 @@ class DocumentAnalysisWorkflow:
         """Process document and extract text"""
         step.progress = 10.0
         
-        processed_doc = self.document_processor.extract_text_from_file(
-            context['file_content'], 
+        # PDF/DOCX parsing is blocking CPU/IO work; keep it off the event loop
+        processed_doc = await asyncio.to_thread(
+            self.document_processor.extract_text_from_file,
+            context['file_content'],
             context['filename']
         )
         
@@ -384,7 +401,8 @@ class DocumentAnalysisWorkflow:
         if not processed_doc:
             raise ValueError("No processed document available for PII redaction")
         
-        redacted_text, redactions = self.document_processor.redact_pii(
+        redacted_text, redactions = await asyncio.to_thread(
+            self.document_processor.redact_pii,
             processed_doc.content,
             context['redaction_level']
         )
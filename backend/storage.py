@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Storage backends for users, documents and analysis results
+
+InMemoryStorage keeps everything in process (single worker only); RedisStorage
+shares state across uvicorn workers and survives restarts. Pick one with
+create_storage(), which uses Redis when REDIS_URL is set.
+"""
+
+import os
+import time
+import zlib
+import logging
+from collections import defaultdict
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+import orjson
+from cachetools import TTLCache
+
+# Optional shared storage dependency
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+class InMemoryStorage:
+    """Process-local storage backed by dicts"""
+
+    def __init__(self, seed_users: Dict[str, Dict[str, Any]]):
+        self.users_db: Dict[str, Dict[str, Any]] = dict(seed_users)
+        self.users_by_id: Dict[str, Dict[str, Any]] = {user["user_id"]: user for user in seed_users.values()}
+        self.documents_db: Dict[str, Dict[str, Any]] = {}
+        self.analysis_results_db: Dict[str, Dict[str, Any]] = {}
+
+        # user_id -> document ids in upload order (a dict used as an ordered set)
+        self.user_documents: Dict[str, Dict[str, None]] = defaultdict(dict)
+
+    async def init(self):
+        """Nothing to prepare for in-process storage"""
+
+    # Users
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return self.users_db.get(email)
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self.users_by_id.get(user_id)
+
+    async def save_user(self, user: Dict[str, Any]):
+        self.users_db[user["email"]] = user
+        self.users_by_id[user["user_id"]] = user
+
+    # Documents
+    async def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        return self.documents_db.get(document_id)
+
+    async def save_document(self, document: Dict[str, Any]):
+        self.documents_db[document["document_id"]] = document
+        self.user_documents[document["user_id"]][document["document_id"]] = None
+
+    async def update_document(self, document_id: str, fields: Dict[str, Any],
+                              analysis: Optional[Dict[str, Any]] = None) -> bool:
+        """Apply fields (and save an analysis) only if the document still exists; returns whether it did"""
+        document = self.documents_db.get(document_id)
+        if document is None:
+            return False
+        document.update(fields)
+        if analysis is not None:
+            self.analysis_results_db[document_id] = analysis
+        return True
+
+    async def delete_document(self, document: Dict[str, Any]):
+        document_id = document["document_id"]
+        self.documents_db.pop(document_id, None)
+        self.analysis_results_db.pop(document_id, None)
+        self.user_documents[document["user_id"]].pop(document_id, None)
+
+    async def list_documents(self, user_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return a user's documents, newest first"""
+        document_ids = islice(reversed(self.user_documents[user_id]), offset, None if limit is None else offset + limit)
+        return [self.documents_db[doc_id] for doc_id in document_ids]
+
+    async def count_documents(self, user_id: str) -> int:
+        return len(self.user_documents[user_id])
+
+    # Analysis results
+    async def get_analysis(self, document_id: str) -> Optional[Dict[str, Any]]:
+        return self.analysis_results_db.get(document_id)
+
+    async def save_analysis(self, document_id: str, result: Dict[str, Any]):
+        self.analysis_results_db[document_id] = result
+
+    async def list_analyses(self, document_ids: List[str]) -> List[Dict[str, Any]]:
+        return [self.analysis_results_db[doc_id] for doc_id in document_ids if doc_id in self.analysis_results_db]
+
+    async def counts(self) -> Dict[str, int]:
+        return {
+            "users": len(self.users_db),
+            "documents": len(self.documents_db),
+            "analysis_results": len(self.analysis_results_db)
+        }
+
+class RedisStorage:
+    """Redis-backed storage shared by all workers
+
+    Keys:
+        user:{id}            orjson user record
+        user_email:{email}   user id
+        doc:{id}             orjson document record
+        user:{id}:docs       sorted set of document ids scored by upload time
+        analysis:{id}        zlib-compressed orjson analysis result
+        users / documents / analyses   id sets used for counts
+    """
+
+    def __init__(self, url: str, seed_users: Dict[str, Dict[str, Any]]):
+        if aioredis is None:
+            raise RuntimeError("REDIS_URL is set but the redis package is not installed")
+
+        self.redis = aioredis.from_url(url)
+        self._seed_users = seed_users
+
+        # Short-lived local cache in front of analysis results, which are large and read often
+        self._analysis_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+
+    async def init(self):
+        """Seed default users without overwriting existing records"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for email, user in self._seed_users.items():
+                pipe.set(f"user:{user['user_id']}", orjson.dumps(user), nx=True)
+                pipe.set(f"user_email:{email}", user["user_id"], nx=True)
+                pipe.sadd("users", user["user_id"])
+            await pipe.execute()
+
+    # Users
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        user_id = await self.redis.get(f"user_email:{email}")
+        return await self.get_user(user_id.decode()) if user_id else None
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        data = await self.redis.get(f"user:{user_id}")
+        return orjson.loads(data) if data else None
+
+    async def save_user(self, user: Dict[str, Any]):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(f"user:{user['user_id']}", orjson.dumps(user))
+            pipe.set(f"user_email:{user['email']}", user["user_id"])
+            pipe.sadd("users", user["user_id"])
+            await pipe.execute()
+
+    # Documents
+    async def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        data = await self.redis.get(f"doc:{document_id}")
+        return orjson.loads(data) if data else None
+
+    async def save_document(self, document: Dict[str, Any]):
+        document_id = document["document_id"]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(f"doc:{document_id}", orjson.dumps(document))
+            # NX keeps the original upload time as the score on later updates
+            pipe.zadd(f"user:{document['user_id']}:docs", {document_id: time.time()}, nx=True)
+            pipe.sadd("documents", document_id)
+            await pipe.execute()
+
+    async def update_document(self, document_id: str, fields: Dict[str, Any],
+                              analysis: Optional[Dict[str, Any]] = None) -> bool:
+        """Apply fields (and save an analysis) only if the document still exists; returns whether it did
+
+        WATCH on the document key makes a concurrent delete abort the transaction, which
+        is then retried against the current state.
+        """
+        key = f"doc:{document_id}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    data = await pipe.get(key)
+                    if data is None:
+                        await pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    pipe.set(key, orjson.dumps({**orjson.loads(data), **fields}))
+                    if analysis is not None:
+                        pipe.set(f"analysis:{document_id}", zlib.compress(orjson.dumps(analysis)))
+                        pipe.sadd("analyses", document_id)
+                    await pipe.execute()
+                    break
+                except aioredis.WatchError:
+                    continue
+        if analysis is not None:
+            self._analysis_cache[document_id] = analysis
+        return True
+
+    async def delete_document(self, document: Dict[str, Any]):
+        document_id = document["document_id"]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(f"doc:{document_id}", f"analysis:{document_id}")
+            pipe.zrem(f"user:{document['user_id']}:docs", document_id)
+            pipe.srem("documents", document_id)
+            pipe.srem("analyses", document_id)
+            await pipe.execute()
+        self._analysis_cache.pop(document_id, None)
+
+    async def list_documents(self, user_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return a user's documents, newest first"""
+        stop = -1 if limit is None else offset + limit - 1
+        document_ids = await self.redis.zrevrange(f"user:{user_id}:docs", offset, stop)
+        if not document_ids:
+            return []
+        records = await self.redis.mget([b"doc:" + doc_id for doc_id in document_ids])
+        return [orjson.loads(data) for data in records if data]
+
+    async def count_documents(self, user_id: str) -> int:
+        return await self.redis.zcard(f"user:{user_id}:docs")
+
+    # Analysis results
+    async def get_analysis(self, document_id: str) -> Optional[Dict[str, Any]]:
+        result = self._analysis_cache.get(document_id)
+        if result is None:
+            data = await self.redis.get(f"analysis:{document_id}")
+            if data is None:
+                return None
+            result = self._analysis_cache[document_id] = orjson.loads(zlib.decompress(data))
+        return result
+
+    async def save_analysis(self, document_id: str, result: Dict[str, Any]):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(f"analysis:{document_id}", zlib.compress(orjson.dumps(result)))
+            pipe.sadd("analyses", document_id)
+            await pipe.execute()
+        self._analysis_cache[document_id] = result
+
+    async def list_analyses(self, document_ids: List[str]) -> List[Dict[str, Any]]:
+        found = {doc_id: self._analysis_cache[doc_id] for doc_id in document_ids if doc_id in self._analysis_cache}
+        missing = [doc_id for doc_id in document_ids if doc_id not in found]
+        if missing:
+            records = await self.redis.mget([f"analysis:{doc_id}" for doc_id in missing])
+            for doc_id, data in zip(missing, records):
+                if data:
+                    found[doc_id] = self._analysis_cache[doc_id] = orjson.loads(zlib.decompress(data))
+        return [found[doc_id] for doc_id in document_ids if doc_id in found]
+
+    async def counts(self) -> Dict[str, int]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.scard("users")
+            pipe.scard("documents")
+            pipe.scard("analyses")
+            users, documents, analyses = await pipe.execute()
+        return {"users": users, "documents": documents, "analysis_results": analyses}
+
+def create_storage(seed_users: Dict[str, Dict[str, Any]]):
+    """Return Redis storage when REDIS_URL is configured, otherwise in-memory storage"""
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        logger.info("Using Redis storage")
+        return RedisStorage(redis_url, seed_users)
+    return InMemoryStorage(seed_users)